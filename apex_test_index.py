@@ -0,0 +1,222 @@
+"""
+    Find the Apex test classes impacted by a delta.
+    Apex classes and triggers are scanned for identifier references and
+    the index is saved under .sfci-cache/, only re-scanning files whose
+    blob SHA changed. The tests to run are the test classes which
+    reference the changed classes, directly or through other classes
+    and triggers (a trigger leads to the tests of its object).
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import deque
+
+# import local scripts
+import check_package_dir
+import manifest_merge
+
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+INDEX_FILE = os.path.join('.sfci-cache', 'apex_refs.json')
+INDEX_VERSION = 1
+# comments and string literals don't count as references
+noise_pattern = re.compile(r"//[^\n]*|/\*.*?\*/|'(?:\\.|[^'\\])*'", re.S)
+identifier_pattern = re.compile(r'[A-Za-z_]\w*')
+test_annotation_pattern = re.compile(r'@istest\b', re.I)
+trigger_pattern = re.compile(r'\btrigger\s+(\w+)\s+on\s+(\w+)', re.I)
+# triggers are kept apart from classes in the reference graph, ':' isn't valid in a name
+TRIGGER_PREFIX = 'trigger:'
+
+
+def parse_args():
+    """
+        Function to parse required arguments.
+        manifest - delta package.xml with the changed ApexClass/ApexTrigger members
+        json - sfdx-project.json to find the package directories
+        index - file where the reference index is saved
+    """
+    parser = argparse.ArgumentParser(description='A script to find the impacted Apex tests.')
+    parser.add_argument('-m', '--manifest', default='delta.xml')
+    parser.add_argument('-j', '--json', default='./sfdx-project.json')
+    parser.add_argument('-i', '--index', default=INDEX_FILE)
+    args = parser.parse_args()
+    return args
+
+
+def blob_sha(content):
+    """
+        Compute the git blob SHA of the file content.
+    """
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+def find_apex_files(source_folder):
+    """
+        Generator which yields every class and trigger in the source folder.
+    """
+    for folder, _dirs, files in os.walk(source_folder):
+        kind = os.path.basename(folder)
+        for file_name in files:
+            if (kind == 'classes' and file_name.endswith('.cls')) or \
+                    (kind == 'triggers' and file_name.endswith('.trigger')):
+                yield os.path.join(folder, file_name)
+
+
+def scan_file(path, content):
+    """
+        Tokenize a class or trigger.
+        Returns its name, kind, test flags and referenced identifiers.
+    """
+    text = noise_pattern.sub(' ', content.decode('utf-8', errors='replace'))
+    identifiers = {identifier.lower() for identifier in identifier_pattern.findall(text)}
+    name = os.path.basename(path).split('.')[0]
+    entry = {'name': name, 'kind': 'trigger' if path.endswith('.trigger') else 'class'}
+    annotations = len(test_annotation_pattern.findall(text))
+    entry['is_test'] = annotations > 0
+    # a test class needs test methods, test data factories only have the class annotation
+    entry['has_tests'] = annotations > 1 or 'testmethod' in identifiers
+    trigger = trigger_pattern.search(text)
+    if entry['kind'] == 'trigger' and trigger:
+        entry['sobject'] = trigger.group(2).lower()
+    identifiers.discard(name.lower())
+    entry['refs'] = sorted(identifiers)
+    return entry
+
+
+def load_index(index_file):
+    """
+        Function to read the saved index, or start an empty one.
+    """
+    try:
+        with open(index_file, encoding='utf-8') as file:
+            index = json.load(file)
+        if index.get('version') == INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {'version': INDEX_VERSION, 'files': {}}
+
+
+def update_index(source_folders, index_file=INDEX_FILE):
+    """
+        Function to scan the source folders and update the saved index.
+        Files are only tokenized again when their blob SHA changed.
+    """
+    index = load_index(index_file)
+    files = {}
+    rescanned = 0
+    for source_folder in source_folders:
+        for path in find_apex_files(source_folder):
+            with open(path, 'rb') as file:
+                content = file.read()
+            sha = blob_sha(content)
+            entry = index['files'].get(path)
+            if entry is None or entry['sha'] != sha:
+                entry = scan_file(path, content)
+                entry['sha'] = sha
+                rescanned += 1
+            files[path] = entry
+    index['files'] = files
+    os.makedirs(os.path.dirname(index_file) or '.', exist_ok=True)
+    with open(index_file, 'w', encoding='utf-8') as file:
+        json.dump(index, file)
+    logging.info('Apex reference index: %s files, %s scanned again', len(files), rescanned)
+    return index
+
+
+def build_references(index):
+    """
+        Build the reverse reference graph.
+        Returns name -> classes and triggers referencing it (triggers with
+        TRIGGER_PREFIX), the class entries by name and the trigger entries
+        by name (all names in lower case).
+    """
+    classes = {}
+    triggers = {}
+    for entry in index['files'].values():
+        if entry['kind'] == 'class':
+            classes[entry['name'].lower()] = entry
+        else:
+            triggers[entry['name'].lower()] = entry
+    referenced_by = {}
+    for name, entry in classes.items():
+        for reference in entry['refs']:
+            referenced_by.setdefault(reference, set()).add(name)
+    for name, entry in triggers.items():
+        for reference in entry['refs']:
+            referenced_by.setdefault(reference, set()).add(TRIGGER_PREFIX + name)
+    return referenced_by, classes, triggers
+
+
+def object_tests(trigger, referenced_by, classes):
+    """
+        Function to list the test classes which reference the trigger object directly.
+    """
+    if trigger is None or 'sobject' not in trigger:
+        return set()
+    return {classes[caller]['name'] for caller in referenced_by.get(trigger['sobject'], ())
+            if caller in classes and classes[caller]['has_tests']}
+
+
+def find_tests(index, apex_classes, apex_triggers):
+    """
+        Function to find the test classes impacted by the changed classes and triggers.
+        Classes: every test class which references them, directly or through other classes.
+        Triggers, changed or calling a changed class: every test class which
+        references the trigger object directly.
+    """
+    referenced_by, classes, triggers = build_references(index)
+    tests = set()
+
+    # walk the reverse references from each changed class
+    queue = deque(name.lower() for name in apex_classes)
+    seen = set(queue)
+    while queue:
+        name = queue.popleft()
+        if name.startswith(TRIGGER_PREFIX):
+            tests.update(object_tests(triggers.get(name[len(TRIGGER_PREFIX):]),
+                                      referenced_by, classes))
+            continue
+        entry = classes.get(name)
+        if entry and entry['has_tests']:
+            tests.add(entry['name'])
+        for caller in referenced_by.get(name, ()):
+            if caller not in seen:
+                seen.add(caller)
+                queue.append(caller)
+
+    for trigger_name in apex_triggers:
+        tests.update(object_tests(triggers.get(trigger_name.lower()), referenced_by, classes))
+    return sorted(tests)
+
+
+def tests_for_manifest(manifest, json_file, index_file=INDEX_FILE):
+    """
+        Function to find the tests to run for the Apex members of a manifest.
+    """
+    changes, _stats = manifest_merge.merge_manifests([manifest])
+    apex_classes = changes.get('ApexClass', set())
+    apex_triggers = changes.get('ApexTrigger', set())
+    if not apex_classes and not apex_triggers:
+        return []
+    index = update_index(check_package_dir.package_paths(json_file), index_file)
+    tests = find_tests(index, apex_classes, apex_triggers)
+    logging.info('Impacted Apex tests: %s', ','.join(tests) or 'none')
+    return tests
+
+
+def main(manifest, json_file, index_file):
+    """
+        Main function to print the impacted tests as a comma-separated list.
+    """
+    tests = tests_for_manifest(manifest, json_file, index_file)
+    # Print variable so it can be stored in a variable
+    print(','.join(tests))
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    main(inputs.manifest, inputs.json, inputs.index)
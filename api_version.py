@@ -5,45 +5,247 @@
     the sfdx-project.json file with the latest API version.
 """
 import argparse
+import http.client
 import json
 import logging
 import os
+import queue
 import sys
+import threading
+import time
+import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 # format logger
 logging.basicConfig(format='%(message)s', level=logging.DEBUG)
 
+# ETag/Last-Modified of each URL for conditional requests
+HTTP_CACHE_FILE = os.path.join('.sfci-cache', 'api_versions_http.json')
 
-def parse_args():
+
+def parse_args(argv=None):
     """
         Function to parse required arguments.
         url - URL which contains all supported API versions
         file - sfdx-project.json
+        batch - JSON file of org URL and sfdx-project.json pairs to check concurrently
+            [{"url": "https://org.my.salesforce.com/services/data/",
+              "file": "repo/sfdx-project.json"}]
+        workers - number of concurrent requests in batch mode
+        timeout - seconds to wait for each request
+        retries - number of retries of a failed request in batch mode
+        output - batch report format, table or json
     """
     parser = argparse.ArgumentParser(description='A script to determine the latest API version.')
     parser.add_argument('-u', '--url')
     parser.add_argument('-f', '--file', default='./sfdx-project.json')
-    args = parser.parse_args()
+    parser.add_argument('-b', '--batch', default=None)
+    parser.add_argument('-w', '--workers', type=int, default=8)
+    parser.add_argument('-t', '--timeout', type=float, default=30)
+    parser.add_argument('-r', '--retries', type=int, default=2)
+    parser.add_argument('-o', '--output', choices=['table', 'json'], default='table')
+    args = parser.parse_args(argv)
     return args
 
 
-def find_latest_version(salesforce_url):
+def find_latest_version(salesforce_url, timeout=30):
     """
         Function to open the URL as a JSON and
         find the latest API version.
     """
-    with urllib.request.urlopen(salesforce_url) as json_file:
+    with urllib.request.urlopen(salesforce_url, timeout=timeout) as json_file:
         json_data = json.loads(json_file.read().decode('utf8'))
-
-    # add all versions to an array
-    api_versions = []
-    for element in json_data:
-        # convert to float due to decimal
-        api_verison = float(element['version'])
-        api_versions.append(api_verison)
     # return latest version
-    return max(api_versions)
+    return latest_from_json(json_data)
+
+
+def latest_from_json(json_data):
+    """
+        Function to return the latest version of the versions list.
+    """
+    # convert to float due to decimal
+    return max(float(element['version']) for element in json_data)
+
+
+class ConnectionPool(object):
+    """
+        Class to reuse HTTP connections per host between threads.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # (scheme, host, port) -> queue of idle connections
+        self.idle = {}
+
+    def request(self, url, headers):
+        """
+            Send a GET request on an idle (or new) connection.
+            Returns the status, response headers and body.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self.lock:
+            idle = self.idle.setdefault(key, queue.SimpleQueue())
+        try:
+            connection = idle.get_nowait()
+        except queue.Empty:
+            if parts.scheme == 'https':
+                connection = http.client.HTTPSConnection(parts.hostname, parts.port,
+                                                         timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(parts.hostname, parts.port,
+                                                        timeout=self.timeout)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        # keep the connection for the next request to this host
+        idle.put(connection)
+        return response.status, response.headers, body
+
+    def close(self):
+        """
+            Close every idle connection.
+        """
+        for idle in self.idle.values():
+            while not idle.empty():
+                idle.get_nowait().close()
+
+
+def load_http_cache():
+    """
+        Function to read the conditional request cache.
+    """
+    try:
+        with open(HTTP_CACHE_FILE, encoding='utf-8') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_http_cache(http_cache):
+    """
+        Function to write the conditional request cache.
+    """
+    os.makedirs(os.path.dirname(HTTP_CACHE_FILE), exist_ok=True)
+    with open(HTTP_CACHE_FILE, 'w', encoding='utf-8') as cache_file:
+        json.dump(http_cache, cache_file, indent=4)
+
+
+def fetch_latest_version(pool, url, http_cache, retries):
+    """
+        Function to find the latest API version of one org.
+        Sends If-None-Match/If-Modified-Since when the URL was fetched
+        before and reuses the cached version on 304 Not Modified.
+    """
+    cached = http_cache.get(url, {})
+    headers = {'Accept': 'application/json'}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    for attempt in range(retries + 1):
+        try:
+            status, response_headers, body = pool.request(url, headers)
+            if status == 304 and 'version' in cached:
+                return cached['version']
+            if status != 200:
+                raise OSError(f'HTTP {status}')
+            version = latest_from_json(json.loads(body.decode('utf8')))
+            http_cache[url] = {'etag': response_headers.get('ETag'),
+                               'last_modified': response_headers.get('Last-Modified'),
+                               'version': version}
+            return version
+        except (OSError, ValueError, KeyError, http.client.HTTPException) as exception:
+            if attempt == retries:
+                raise
+            logging.debug('Retrying %s after error: %s', url, exception)
+            time.sleep(2 ** attempt)
+    return None
+
+
+def read_source_version(json_path):
+    """
+        Function to return sourceApiVersion of a sfdx-project.json file.
+    """
+    try:
+        with open(os.path.abspath(json_path), encoding='utf-8') as json_file:
+            return json.load(json_file).get('sourceApiVersion')
+    except (OSError, ValueError):
+        return None
+
+
+def check_projects(pairs, workers, timeout, retries):
+    """
+        Function to check every (org URL, sfdx-project.json) pair concurrently.
+        Each org URL is only requested once.
+        Returns a list of report rows.
+    """
+    http_cache = load_http_cache()
+    pool = ConnectionPool(timeout)
+    urls = sorted({pair['url'] for pair in pairs})
+    latest = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {url: executor.submit(fetch_latest_version, pool, url, http_cache, retries)
+                   for url in urls}
+        for url, future in futures.items():
+            try:
+                latest[url] = future.result()
+            except (OSError, ValueError, KeyError, http.client.HTTPException) as exception:
+                logging.warning('WARNING: %s failed: %s', url, exception)
+                latest[url] = None
+    pool.close()
+    save_http_cache(http_cache)
+
+    rows = []
+    for pair in pairs:
+        source_version = read_source_version(pair['file'])
+        latest_version = latest[pair['url']]
+        behind = None
+        if latest_version is not None and source_version:
+            behind = float(source_version) < latest_version
+        rows.append({'file': pair['file'], 'url': pair['url'],
+                     'source_version': source_version, 'latest_version': latest_version,
+                     'behind': behind})
+    return rows
+
+
+def print_report(rows, output):
+    """
+        Function to print the batch report as a table or JSON.
+    """
+    if output == 'json':
+        print(json.dumps(rows, indent=4))
+        return
+    print(f'{"PROJECT":<50} {"SOURCE":>8} {"LATEST":>8}  STATUS')
+    for row in rows:
+        if row['behind'] is None:
+            status = 'UNKNOWN'
+        else:
+            status = 'BEHIND' if row['behind'] else 'OK'
+        print(f'{row["file"]:<50} {str(row["source_version"]):>8} '
+              f'{str(row["latest_version"]):>8}  {status}')
+
+
+def batch_main(batch_file, workers, timeout, retries, output):
+    """
+        Batch function to report which projects are behind
+        the latest API version of their org.
+        Returns 1 if any project is behind.
+    """
+    with open(batch_file, encoding='utf-8') as file:
+        pairs = json.load(file)
+    rows = check_projects(pairs, workers, timeout, retries)
+    print_report(rows, output)
+    return 1 if any(row['behind'] for row in rows) else 0
 
 
 def update_json_file(latest_version, json_path):
@@ -84,6 +286,17 @@ def main(url, json_file):
     update_json_file(latest_api_version, json_file)
 
 
-if __name__ == '__main__':
-    inputs = parse_args()
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+        Returns the exit code.
+    """
+    if inputs.batch:
+        return batch_main(inputs.batch, inputs.workers, inputs.timeout,
+                          inputs.retries, inputs.output)
     main(inputs.url, inputs.file)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
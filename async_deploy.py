@@ -0,0 +1,171 @@
+"""
+    Submit deployments without waiting and poll their status.
+    Submitted deployment IDs are saved to a state file so a later
+    CI job can resume polling them. Finished deployments are removed
+    from the state file once their result was reported.
+"""
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+# import local script
+import metrics
+
+# first and maximum delay between two status checks, in seconds
+BASE_DELAY = 5
+MAX_DELAY = 120
+
+
+def run_json_command(command):
+    """
+        Function to run an sfdx command with --json and return the parsed output.
+        sfdx exits with an error when a deployment failed but still prints JSON.
+    """
+    with metrics.stage('sfdx', command=command[1]) as record:
+        output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True,
+                                encoding='utf-8', check=False)
+        record['returncode'] = output.returncode
+    try:
+        return json.loads(output.stdout)
+    except json.JSONDecodeError:
+        logging.error('Unexpected output from %s: %s', command[1], output.stdout)
+        return {'status': output.returncode or 1, 'result': {}}
+
+
+def load_state(state_file):
+    """
+        Function to read the deployments from the state file.
+    """
+    if not os.path.isfile(state_file):
+        return {'deployments': []}
+    with open(state_file, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_state(state, state_file):
+    """
+        Function to write the state file, replacing it atomically.
+    """
+    temp_file = f'{state_file}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=4)
+    os.replace(temp_file, state_file)
+
+
+def in_flight(state, deploy_ids=None):
+    """
+        Function to return the deployments which are not done yet,
+        only the deployment IDs if set.
+    """
+    return [deployment for deployment in state['deployments'] if not deployment.get('done')
+            and (deploy_ids is None or deployment['id'] in deploy_ids)]
+
+
+def backoff_delay(attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """
+        Exponential backoff with jitter: half of the delay is fixed,
+        the other half is random so parallel jobs don't poll together.
+    """
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def check_status(deployment):
+    """
+        Function to fetch the status of a deployment and update it.
+        Returns True if the progress changed since the last check.
+    """
+    command = ['sfdx', 'force:source:deploy:report', '-i', deployment['id'], '-w', '0', '--json']
+    if deployment.get('alias'):
+        command.extend(['-u', deployment['alias']])
+    result = run_json_command(command).get('result') or {}
+    progress = {
+        'status': result.get('status', deployment.get('status')),
+        'done': bool(result.get('done', False)),
+        'success': bool(result.get('success', False)),
+        'components_deployed': result.get('numberComponentsDeployed', 0),
+        'components_total': result.get('numberComponentsTotal', 0),
+        'component_errors': result.get('numberComponentErrors', 0),
+        'tests_completed': result.get('numberTestsCompleted', 0),
+        'tests_total': result.get('numberTestsTotal', 0),
+        'test_errors': result.get('numberTestErrors', 0),
+    }
+    changed = any(deployment.get(key) != value for key, value in progress.items())
+    deployment.update(progress)
+    # compact JSON progress line
+    print(json.dumps({'id': deployment['id'], **progress}, separators=(',', ':')))
+    sys.stdout.flush()
+    return changed
+
+
+def poll(state, state_file, timeout, deploy_ids=None):
+    """
+        Function to poll every in-flight deployment (only the deployment IDs if set)
+        until all are done or the timeout (seconds) runs out.
+        Returns the deployments which are still running.
+    """
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while in_flight(state, deploy_ids):
+        changed = False
+        for deployment in in_flight(state, deploy_ids):
+            changed = check_status(deployment) or changed
+        save_state(state, state_file)
+        if not in_flight(state, deploy_ids) or time.monotonic() >= deadline:
+            break
+        # start over with short delays while the deployment is progressing
+        attempt = 0 if changed else attempt + 1
+        time.sleep(min(backoff_delay(attempt), max(0, deadline - time.monotonic())))
+    return in_flight(state, deploy_ids)
+
+
+def submit(command, state_file, max_inflight, timeout, alias=None, manifest=None):
+    """
+        Function to submit a deployment without waiting.
+        If max_inflight deployments are already running, poll them
+        until a slot is free. Returns the deployment ID.
+    """
+    state = load_state(state_file)
+    while max_inflight and len(in_flight(state)) >= max_inflight:
+        logging.info('%s deployments in flight, waiting for a free slot.', len(in_flight(state)))
+        if len(poll(state, state_file, timeout)) >= max_inflight:
+            sys.exit('ERROR: Timed out waiting for an in-flight deployment to finish.')
+
+    data = run_json_command(command)
+    deploy_id = (data.get('result') or {}).get('id')
+    if data.get('status') != 0 or not deploy_id:
+        logging.error(data.get('message', 'ERROR: The deployment was not submitted.'))
+        sys.exit(1)
+    state['deployments'].append({'id': deploy_id, 'alias': alias, 'manifest': manifest,
+                                 'submitted': time.time(), 'done': False})
+    save_state(state, state_file)
+    logging.info('Submitted deployment %s, saved to %s', deploy_id, state_file)
+    return deploy_id
+
+
+def resume(state_file, timeout, deploy_ids=None):
+    """
+        Function to poll the deployments of the state file, only the
+        deployment IDs if set, and remove them from the state file once done.
+        Returns 0 if every deployment succeeded, 1 otherwise.
+    """
+    state = load_state(state_file)
+    if deploy_ids is None:
+        # reported deployments are removed, so every deployment left is judged
+        deploy_ids = [deployment['id'] for deployment in state['deployments']]
+    if poll(state, state_file, timeout, deploy_ids):
+        logging.error('ERROR: Deployments still running, resume later with the state file.')
+        return 1
+    failed = [deployment['id'] for deployment in state['deployments']
+              if deployment['id'] in deploy_ids and not deployment.get('success')]
+    state['deployments'] = [deployment for deployment in state['deployments']
+                            if deployment['id'] not in deploy_ids]
+    save_state(state, state_file)
+    if failed:
+        logging.error('ERROR: Deployments failed: %s', ', '.join(failed))
+        return 1
+    return 0
@@ -1,74 +1,179 @@
 """
     Install Salesforce CLI and append it to your environment path before running this script.
+    Authenticate one org with --alias/--url, or several orgs at the same time
+    with --orgs (JSON file of alias -> auth URL) or --env_prefix
+    (environment variables named <prefix><alias> holding the auth URL).
 """
 import argparse
+import json
 import logging
 import os
 import subprocess
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# import local script
+import metrics
 
 # format logger
 logging.basicConfig(format='%(message)s', level=logging.DEBUG)
 
 
-def parse_args():
+def parse_args(argv=None):
     """
         Function to parse required arguments.
         alias - alias to set
         url - authorization URL (do not store in quotes)
+        orgs - JSON file with the alias -> authorization URL of several orgs
+        env_prefix - read the authorization URL of several orgs from the
+            environment variables starting with this prefix
+        default - alias to set as the default username and dev hub
+            when authenticating several orgs
+        concurrency - maximum number of orgs authenticated at the same time
+        metrics - append the timing of each stage to this JSON-lines file
+        profile - dump the cProfile stats of the run to this file
     """
     parser = argparse.ArgumentParser(description='A script to authenticate to Salesforce.')
     parser.add_argument('-a', '--alias')
     parser.add_argument('-u', '--url')
-    args = parser.parse_args()
+    parser.add_argument('-o', '--orgs', default=None)
+    parser.add_argument('-e', '--env_prefix', default=None)
+    parser.add_argument('-d', '--default', default=None)
+    parser.add_argument('-p', '--concurrency', type=int, default=4)
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--profile', default=None)
+    args = parser.parse_args(argv)
     return args
 
 
-def make_temp_file(url):
+def load_orgs(orgs_file=None, env_prefix=None):
     """
-        Function to create the temporary file with the URL
+        Function to build the alias -> authorization URL mapping
+        from the JSON file and the environment variables.
     """
-    file_name = 'temp_file.txt'
-    file = open(file_name, 'w', encoding='utf-8')
-    file.write(url)
-    file.close()
-    return os.path.abspath(file_name)
+    orgs = {}
+    if orgs_file:
+        with open(orgs_file, encoding='utf-8') as file:
+            orgs.update(json.load(file))
+    if env_prefix:
+        for name, value in os.environ.items():
+            if name.startswith(env_prefix) and len(name) > len(env_prefix) and value:
+                orgs[name[len(env_prefix):]] = value
+    return orgs
 
 
-def run_command(cmd):
+def store_auth_url(alias, url):
     """
-        Function to run the command using the native shell
+        Function to authenticate one org from its authorization URL.
+        The URL is written to a private temporary file which is removed afterwards.
+        Returns the exit code, the error output and the elapsed seconds.
     """
+    start = time.monotonic()
+    # mkstemp creates the file readable by the current user only
+    file_descriptor, url_file = tempfile.mkstemp(prefix='sfdx_auth_', suffix='.txt')
     try:
-        subprocess.run(cmd, check=True, shell=True)
-    except subprocess.CalledProcessError:
-        sys.exit(1)
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            file.write(url)
+        # Do not expose the URL in the logs
+        command = ['sfdx', 'force:auth:sfdxurl:store', '--sfdxurlfile', url_file,
+                   '--setalias', alias, '--json']
+        logging.info('sfdx force:auth:sfdxurl:store --setalias %s', alias)
+        with metrics.stage('sfdx', command=command[1], alias=alias) as record:
+            try:
+                output = subprocess.run(command, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.PIPE, check=False)
+                returncode, error = output.returncode, output.stderr.decode('utf-8', 'replace')
+            except OSError as exception:
+                returncode, error = 1, str(exception)
+            record['returncode'] = returncode
+    finally:
+        os.remove(url_file)
+    return returncode, error.strip(), time.monotonic() - start
+
+
+def set_default(alias):
+    """
+        Function to set the default username and dev hub in one call.
+        Returns the exit code.
+    """
+    command = ['sfdx', 'force:config:set', f'defaultusername={alias}',
+               f'defaultdevhubusername={alias}']
+    logging.info(' '.join(command))
+    with metrics.stage('sfdx', command=command[1], alias=alias) as record:
+        try:
+            record['returncode'] = subprocess.run(command, check=False).returncode
+        except OSError as exception:
+            logging.error('ERROR: %s', exception)
+            record['returncode'] = 1
+    return record['returncode']
+
+
+def authenticate_orgs(orgs, concurrency, default_alias=None):
+    """
+        Function to authenticate the orgs with a bounded worker pool
+        and log a timing table. Returns 1 if any org failed.
+    """
+    aliases = sorted(orgs)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = list(executor.map(lambda alias: store_auth_url(alias, orgs[alias]), aliases))
+
+    logging.info('%-30s %-8s %10s', 'ALIAS', 'STATUS', 'SECONDS')
+    failed = []
+    for alias, (returncode, error, seconds) in zip(aliases, results):
+        logging.info('%-30s %-8s %10.1f', alias, 'OK' if returncode == 0 else 'FAILED', seconds)
+        if returncode != 0:
+            failed.append(alias)
+            logging.error('ERROR: %s: %s', alias, error or f'exit code {returncode}')
+
+    # the config file is shared, so it is only written once after the logins
+    if default_alias and default_alias not in failed:
+        if set_default(default_alias) != 0:
+            failed.append(default_alias)
+    return 1 if failed else 0
 
 
 def main(alias, url):
     """
         Main function to authenticate to Salesforce.
     """
-    # Create temporary file to store the URL
-    url_file = make_temp_file(url)
+    returncode, error, _seconds = store_auth_url(alias, url)
+    if returncode != 0:
+        logging.error('ERROR: %s', error)
+        sys.exit(1)
+    if set_default(alias) != 0:
+        sys.exit(1)
 
-    # Set all commands
-    # Do not expose the URL in the logs
-    commands = []
-    commands.append(f'sfdx force:auth:sfdxurl:store --sfdxurlfile {url_file}'
-                    f' --setalias {alias} --json > /dev/null')
-    commands.append(f'sfdx force:config:set defaultusername={alias}')
-    commands.append(f'sfdx force:config:set defaultdevhubusername={alias}')
 
-    # Run each command one after the other
-    for command in commands:
-        logging.info(command)
-        run_command(command)
+def authenticate(inputs):
+    """
+        Function to authenticate one org, or several orgs
+        if a JSON file or an environment prefix is given.
+        Returns the exit code.
+    """
+    if inputs.orgs or inputs.env_prefix:
+        orgs = load_orgs(inputs.orgs, inputs.env_prefix)
+        if not orgs:
+            logging.error('ERROR: No orgs to authenticate.')
+            return 1
+        if inputs.default and inputs.default not in orgs:
+            logging.error('ERROR: %s is not one of the orgs to authenticate.', inputs.default)
+            return 1
+        return authenticate_orgs(orgs, inputs.concurrency, inputs.default)
+    main(inputs.alias, inputs.url)
+    return 0
+
 
-    # Delete the temporary file
-    os.remove(url_file)
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+        Returns the exit code.
+    """
+    metrics.configure(inputs.metrics)
+    with metrics.profiled(inputs.profile), metrics.stage('authenticate_sfdx'):
+        return authenticate(inputs)
 
 
 if __name__ == '__main__':
-    inputs = parse_args()
-    main(inputs.alias, inputs.url)
+    sys.exit(run(parse_args()))
@@ -0,0 +1,302 @@
+"""
+    Build the delta packages of many commit ranges in one pass.
+    The history is read once with git log --first-parent --raw, the net
+    changes of each range are composed from the commits in it, and the
+    parsed children of each changed container blob are shared between the ranges.
+    Writes one manifest per range and the union of all ranges.
+    python ./batch_delta.py --first_parent v1.0..main
+    python ./batch_delta.py --ranges ranges.txt
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+
+# import local scripts
+import classification_cache
+import create_delta_package
+import git_diff
+import merge_manual_package
+import metrics
+import package_writer
+
+# Format logging message
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+# git uses the zero SHA for a missing blob (added or deleted file)
+ZERO_SHA = '0' * 40
+
+
+def parse_args(argv=None):
+    """
+        Function to parse required arguments.
+        ranges - file with one range per line: <from_ref> <to_ref> (# for comments)
+        first_parent - commit range, e.g. v1.0..main, which gives one range
+            per first-parent commit (each merge of the main branch)
+        json - sfdx-project.json
+        delta - union delta file, each range is written to <delta>_range_<n>.xml
+            and listed in <delta>_ranges.json
+        manifest - manual manifest file to merge with the union delta
+        cache_dir - also keep the classifications in this folder between runs
+    """
+    parser = argparse.ArgumentParser(description='A script to generate the delta of many ranges.')
+    parser.add_argument('-r', '--ranges', default=None)
+    parser.add_argument('-f', '--first_parent', default=None)
+    parser.add_argument('-j', '--json', default='./sfdx-project.json')
+    parser.add_argument('-d', '--delta', default='delta.xml')
+    parser.add_argument('-m', '--manifest', default='manifest/package.xml')
+    parser.add_argument('-c', '--cache_dir', default=None)
+    args = parser.parse_args(argv)
+    return args
+
+
+def read_ranges(ranges_file):
+    """
+        Generator which yields the (from_ref, to_ref) of each line.
+    """
+    with open(ranges_file, encoding='utf-8') as file:
+        for line in file:
+            words = line.split('#')[0].split()
+            if len(words) == 2:
+                yield words[0], words[1]
+            elif words:
+                logging.warning('WARNING: Skipping the range %s', line.strip())
+
+
+def rev_parse(refs):
+    """
+        Function to resolve the refs to commit SHAs with a single git call.
+    """
+    if not refs:
+        return []
+    output = subprocess.run(['git', 'rev-parse', *[f'{ref}^{{commit}}' for ref in refs]],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return output.stdout.split()
+
+
+def iter_log(revisions):
+    """
+        Generator which yields (commit, first parent, changes) for every
+        first-parent commit, newest first. Merges are compared to their
+        first parent. Changes are (status, path, old_sha, new_sha, old_path),
+        renames and copies are reported with the new path like git diff
+        and old_path is their source (None for other changes).
+    """
+    command = ['git', 'log', '--first-parent', '-m', '--raw', '-z', '--no-abbrev',
+               '--format=commit %H %P', *revisions]
+    commit = None
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        records = git_diff.read_nul_records(process.stdout)
+        for record in records:
+            record = record.lstrip('\n')
+            if record.startswith('commit '):
+                if commit is not None:
+                    yield commit
+                shas = record.split()[1:]
+                commit = (shas[0], shas[1] if len(shas) > 1 else None, [])
+                continue
+            # :100644 100644 <old sha> <new sha> <status>
+            fields = record.lstrip(':').split(' ')
+            old_sha, new_sha, status = fields[2], fields[3], fields[4][0]
+            path = next(records)
+            old_path = None
+            # renames and copies list the old path and then the new path
+            if status in ('R', 'C'):
+                old_path, path = path, next(records)
+            commit[2].append((status, path, old_sha, new_sha, old_path))
+        if commit is not None:
+            yield commit
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def compose(change_lists):
+    """
+        Function to compose the changes of consecutive commits (oldest first)
+        into the net change of each path: path -> (status, old_sha, new_sha).
+        Files changed back to their first content are dropped.
+        The source of a rename is deleted, and like git diff a deleted
+        source is folded into the new path when it still exists at the end.
+    """
+    entries = {}
+    # new path of a rename -> (source path, source blob before the range)
+    origins = {}
+    for changes in change_lists:
+        for status, path, old_sha, new_sha, old_path in changes:
+            if status == 'R':
+                if old_path in entries:
+                    origin = origins.pop(old_path, (old_path, entries[old_path][1]))
+                    entries[old_path] = (entries[old_path][0], entries[old_path][1], ZERO_SHA)
+                else:
+                    origin = (old_path, old_sha)
+                    entries[old_path] = ('D', old_sha, ZERO_SHA)
+                # the new path didn't exist before the rename, unless it was deleted earlier
+                if path not in entries:
+                    origins[path] = origin
+                    status, old_sha = 'A', ZERO_SHA
+            if path in entries:
+                entries[path] = (entries[path][0], entries[path][1], new_sha)
+            else:
+                entries[path] = (status, old_sha, new_sha)
+    for path, (origin_path, origin_sha) in origins.items():
+        origin = entries.get(origin_path)
+        if (entries[path][2] != ZERO_SHA and origin_sha != ZERO_SHA and origin is not None
+                and origin[1] == origin_sha and origin[2] == ZERO_SHA):
+            entries[path] = ('R', origin_sha, entries[path][2])
+            del entries[origin_path]
+    net = {}
+    for path, (status, old_sha, new_sha) in entries.items():
+        # a rename keeps its blob, so it stays even with the same SHAs
+        if old_sha == new_sha and status not in ('R', 'C'):
+            continue
+        if old_sha == ZERO_SHA:
+            status = 'A'
+        elif new_sha == ZERO_SHA:
+            status = 'D'
+        elif status not in ('R', 'C'):
+            status = 'M'
+        net[path] = (status, old_sha, new_sha)
+    return net
+
+
+class MemoryCache(object):
+    """
+        Class to share the classifications between the ranges of a run,
+        with the same interface as ClassificationCache.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, blob):
+        """
+            Return the cached list of (component type, members) or None.
+        """
+        result = self.entries.get((path, blob))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, path, blob, result):
+        """
+            Store the list of (component type, members) of a file.
+        """
+        self.entries[(path, blob)] = result
+
+    def close(self):
+        """
+            Log the cache statistics.
+        """
+        logging.info('Classification cache: %s hits, %s misses', self.hits, self.misses)
+
+
+@metrics.timed(name='load_history', count=len)
+def load_history(revisions):
+    """
+        Function to read the first-parent commits of the revisions:
+        commit -> (first parent, changes)
+    """
+    return {commit: (parent, changes) for commit, parent, changes in iter_log(revisions)}
+
+
+def range_diff(from_sha, to_sha, commits):
+    """
+        Function to build the diff of a range from the commits of the history.
+        Falls back to git diff if from_sha is not a first-parent ancestor
+        of to_sha in the history which was read.
+    """
+    chain = []
+    sha = to_sha
+    while sha != from_sha:
+        if sha not in commits:
+            logging.info('%s is not a first-parent ancestor of %s, running git diff',
+                         from_sha[:10], to_sha[:10])
+            return git_diff.GitDiffStream(from_sha, to_sha)
+        chain.append(commits[sha][1])
+        sha = commits[sha][0]
+    return git_diff.GitDiffStream(from_sha, to_sha, compose(reversed(chain)))
+
+
+def list_ranges(ranges_file, first_parent):
+    """
+        Function to resolve the ranges and read the history once.
+        Returns the (from_sha, to_sha) ranges and the commits.
+    """
+    if first_parent:
+        commits = load_history([first_parent])
+        # the log is newest first, deploy order is oldest first
+        ranges = [(parent, commit) for commit, (parent, _changes) in reversed(commits.items())
+                  if parent is not None]
+        return ranges, commits
+
+    refs = list(read_ranges(ranges_file))
+    shas = rev_parse([ref for pair in refs for ref in pair])
+    ranges = list(zip(shas[0::2], shas[1::2]))
+    to_shas = sorted({to_sha for _from_sha, to_sha in ranges})
+    # stop at the common ancestor of the ranges, so overlapping ranges are covered
+    output = subprocess.run(['git', 'merge-base', '--octopus',
+                             *{from_sha for from_sha, _to_sha in ranges}],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=False)
+    commits = load_history(to_shas + ['--not'] + output.stdout.split())
+    return ranges, commits
+
+
+def range_file(delta, number):
+    """
+        Name the delta file of a range, e.g. delta_range_1.xml
+    """
+    base, ext = os.path.splitext(delta)
+    return f'{base}_range_{number}{ext}'
+
+
+def main(ranges_file, first_parent, json_file, delta, manifest, cache_dir=None):
+    """
+        Main function to build the delta of every range and their union.
+    """
+    ranges, commits = list_ranges(ranges_file, first_parent)
+    cache = classification_cache.ClassificationCache(cache_dir) if cache_dir else MemoryCache()
+    union = {}
+    index = []
+    distinct = set()
+    for number, (from_sha, to_sha) in enumerate(ranges, start=1):
+        diffs = range_diff(from_sha, to_sha, commits)
+        metadata_files = create_delta_package.find_metadata_files(diffs, json_file)
+        distinct.update((path, diffs.blob_shas(path)) for path in metadata_files)
+        changed = create_delta_package.build_type_items(metadata_files, diffs, cache, to_sha)
+        output_file = range_file(delta, number)
+        package_writer.create_package_xml(changed, output_file, json_file)
+        for component_type, members in changed.items():
+            union.setdefault(component_type, set()).update(members)
+        index.append({'from': from_sha, 'to': to_sha, 'manifest': output_file,
+                      'components': sum(len(members) for members in changed.values())})
+
+    if manifest:
+        union = merge_manual_package.parse_manual_package(manifest, union)
+    package_writer.create_package_xml(union, delta, json_file)
+    index_file = f'{os.path.splitext(delta)[0]}_ranges.json'
+    with open(index_file, 'w', encoding='utf-8') as file:
+        json.dump({'union': delta, 'ranges': index}, file, indent=4)
+    logging.info('Wrote %s range deltas from %s commits and %s distinct changed files, see %s',
+                 len(index), len(commits), len(distinct), index_file)
+    cache.close()
+
+
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+        Returns the exit code.
+    """
+    if bool(inputs.ranges) == bool(inputs.first_parent):
+        logging.error('ERROR: Set either --ranges or --first_parent.')
+        return 1
+    main(inputs.ranges, inputs.first_parent, inputs.json, inputs.delta,
+         inputs.manifest, inputs.cache_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
@@ -0,0 +1,72 @@
+"""
+    Benchmark of the cold start of the sfci entry point against
+    running each pipeline script as its own process.
+    Every step only prints its help, so this measures start-up and imports.
+    python ./benchmark_cli_startup.py --repeat 5
+"""
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# import local script
+import sfci
+
+# format logger
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    """
+        Function to parse required arguments.
+        repeat - number of runs of each measurement, the median is reported
+    """
+    parser = argparse.ArgumentParser(description='A script to benchmark the CLI start-up.')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+    return args
+
+
+def time_commands(commands, repeat):
+    """
+        Run the commands one after the other and return the median total seconds.
+    """
+    totals = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for command in commands:
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           check=True, cwd=SCRIPT_DIR)
+        totals.append(time.perf_counter() - start)
+    return statistics.median(totals)
+
+
+def main(repeat):
+    """
+        Main function to run the benchmark.
+    """
+    scripts = [[sys.executable, f'{module}.py', '--help'] for module in sfci.COMMANDS.values()]
+    subcommands = [[sys.executable, 'sfci.py', command, '--help'] for command in sfci.COMMANDS]
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as batch_file:
+        batch_file.write(''.join(f'{command} --help\n' for command in sfci.COMMANDS))
+    batch = [[sys.executable, 'sfci.py', 'batch', batch_file.name]]
+    try:
+        results = [('Per-script processes', time_commands(scripts, repeat)),
+                   ('sfci, one process per step', time_commands(subcommands, repeat)),
+                   ('sfci batch, one process', time_commands(batch, repeat))]
+    finally:
+        os.remove(batch_file.name)
+
+    logging.info('%s steps, median of %s runs', len(scripts), repeat)
+    for name, seconds in results:
+        logging.info('%-30s %.3fs (%.1f ms/step)', name, seconds, seconds / len(scripts) * 1000)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    main(inputs.repeat)
@@ -0,0 +1,393 @@
+"""
+    End to end benchmark of create_delta_package on a generated SFDX repo.
+    The repo gets Apex classes, objects with fields, record types and list views,
+    a custom labels file and report/dashboard folders. A commit range then
+    changes a random sample of them and edits then renames a class, and every
+    run of create_delta_package.main (and batch_delta.main in batch mode)
+    is timed per stage and checked against the expected delta.
+    Runs offline: the API version is taken from SF_API_VERSION.
+    python ./benchmark_delta.py --classes 2000 --labels 5000
+        --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# the package.xml footer must not call Salesforce
+os.environ.setdefault('SF_API_VERSION', '58.0')
+
+# import local scripts
+import batch_delta
+import create_delta_package
+import manifest_merge
+import metrics
+
+# format logger
+logging.basicConfig(format='%(message)s', level=logging.INFO)
+SOURCE = os.path.join('force-app', 'main', 'default')
+MODES = ('diff', 'stream', 'cache_cold', 'cache_warm', 'batch')
+SHAPES = ('single', 'linear', 'merge')
+STAGES = ('take_git_diff', 'find_metadata_files', 'build_type_items',
+          'create_package_xml', 'create_delta_package')
+
+
+def parse_args():
+    """
+        Function to parse required arguments.
+        classes - number of Apex classes
+        objects - number of custom objects
+        fields - number of fields, record types and list views of each object
+        labels - number of custom labels
+        reports - number of reports and dashboards, spread over 10 folders
+        changes - number of components changed in the commit range
+        commits - number of commits the changes are spread over
+        shape - single commit, linear history or a merged feature branch
+        repeat - number of runs of each mode, the median is reported
+        seed - random seed used to build the repo and the changes
+        output - JSON file to save the results to
+        compare - JSON file of a previous run to compare the results with
+        keep - keep the generated repo and print its path
+    """
+    parser = argparse.ArgumentParser(description='A script to benchmark the delta package.')
+    parser.add_argument('-n', '--classes', type=int, default=1000)
+    parser.add_argument('-o', '--objects', type=int, default=20)
+    parser.add_argument('-m', '--fields', type=int, default=20)
+    parser.add_argument('-l', '--labels', type=int, default=2000)
+    parser.add_argument('-r', '--reports', type=int, default=200)
+    parser.add_argument('-c', '--changes', type=int, default=300)
+    parser.add_argument('-k', '--commits', type=int, default=5)
+    parser.add_argument('--shape', choices=SHAPES, default='linear')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-s', '--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_delta.json')
+    parser.add_argument('--compare', default=None)
+    parser.add_argument('--keep', default=False, action='store_true')
+    args = parser.parse_args()
+    return args
+
+
+def git(repo, *args):
+    """
+        Run a git command in the generated repo and return its output.
+    """
+    command = ['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@example.com',
+               '-c', 'commit.gpgsign=false', *args]
+    output = subprocess.run(command, cwd=repo, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return output.stdout.strip()
+
+
+def write_file(repo, path, content):
+    """
+        Write a file of the generated repo, creating its folder.
+    """
+    full_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def class_source(name, revision):
+    """
+        Source of a generated Apex class.
+    """
+    return (f'public with sharing class {name} {{\n'
+            f'    public static Integer revision() {{\n'
+            f'        return {revision};\n'
+            '    }\n}\n')
+
+
+def metadata_source(root, revision):
+    """
+        Source of a generated metadata XML file.
+    """
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<{root} xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+            f'    <description>Revision {revision}</description>\n'
+            f'</{root}>\n')
+
+
+def labels_source(revisions):
+    """
+        Source of the custom labels file, one revision per label.
+    """
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<CustomLabels xmlns="http://soap.sforce.com/2006/04/metadata">\n']
+    for number, revision in enumerate(revisions):
+        parts.append('    <labels>\n'
+                     f'        <fullName>Label_{number}</fullName>\n'
+                     '        <language>en_US</language>\n'
+                     '        <protected>false</protected>\n'
+                     f'        <shortDescription>Label {number}</shortDescription>\n'
+                     f'        <value>Value {number} revision {revision}</value>\n'
+                     '    </labels>\n')
+    parts.append('</CustomLabels>\n')
+    return ''.join(parts)
+
+
+def build_components(classes, objects, fields, reports):
+    """
+        List the generated components as (type, member, path, XML root element).
+        The XML root is None for Apex classes.
+    """
+    components = []
+    for number in range(classes):
+        name = f'BenchClass{number}'
+        components.append(('ApexClass', name,
+                           os.path.join(SOURCE, 'classes', f'{name}.cls'), None))
+    for number in range(objects):
+        sobject = f'Bench{number}__c'
+        folder = os.path.join(SOURCE, 'objects', sobject)
+        components.append(('CustomObject', sobject,
+                           os.path.join(folder, f'{sobject}.object-meta.xml'), 'CustomObject'))
+        for child in range(fields):
+            components.append(('CustomField', f'{sobject}.Field{child}__c',
+                               os.path.join(folder, 'fields', f'Field{child}__c.field-meta.xml'),
+                               'CustomField'))
+            components.append(('RecordType', f'{sobject}.Type{child}',
+                               os.path.join(folder, 'recordTypes',
+                                            f'Type{child}.recordType-meta.xml'), 'RecordType'))
+            components.append(('ListView', f'{sobject}.View{child}',
+                               os.path.join(folder, 'listViews', f'View{child}.listView-meta.xml'),
+                               'ListView'))
+    for number in range(reports):
+        folder = f'BenchFolder{number % 10}'
+        components.append(('Report', f'{folder}/Report{number}',
+                           os.path.join(SOURCE, 'reports', folder,
+                                        f'Report{number}.report-meta.xml'), 'Report'))
+        components.append(('Dashboard', f'{folder}/Dashboard{number}',
+                           os.path.join(SOURCE, 'dashboards', folder,
+                                        f'Dashboard{number}.dashboard-meta.xml'), 'Dashboard'))
+    return components
+
+
+def write_component(repo, component, revision):
+    """
+        Write the files of a component at the given revision.
+    """
+    _type, _member, path, root = component
+    if root is None:
+        write_file(repo, path, class_source(os.path.basename(path)[:-4], revision))
+        write_file(repo, path + '-meta.xml', metadata_source('ApexClass', revision))
+    else:
+        write_file(repo, path, metadata_source(root, revision))
+
+
+def rename_class(repo, component):
+    """
+        Rename the files of a class with git mv.
+        Returns the new member name.
+    """
+    _type, member, path, _root = component
+    new_member = f'{member}Renamed'
+    new_path = os.path.join(os.path.dirname(path), f'{new_member}.cls')
+    git(repo, 'mv', path, new_path)
+    git(repo, 'mv', path + '-meta.xml', new_path + '-meta.xml')
+    return new_member
+
+
+def create_repo(repo, params, rng):
+    """
+        Generate the repo and its commit range.
+        Returns the first and last commit of the range and the expected delta.
+    """
+    git(repo, 'init', '-q')
+    write_file(repo, 'sfdx-project.json', json.dumps(
+        {'packageDirectories': [{'path': 'force-app', 'default': True}],
+         'sourceApiVersion': os.environ['SF_API_VERSION']}, indent=4))
+    components = build_components(params['classes'], params['objects'],
+                                  params['fields'], params['reports'])
+    for component in components:
+        write_component(repo, component, 0)
+    label_file = os.path.join(SOURCE, 'labels', 'CustomLabels.labels-meta.xml')
+    label_revisions = [0] * params['labels']
+    write_file(repo, label_file, labels_source(label_revisions))
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', 'baseline')
+    from_ref = git(repo, 'rev-parse', 'HEAD')
+
+    # pick the changed components and labels, then spread them over the commits
+    pool = [('component', component) for component in components]
+    pool += [('label', number) for number in range(params['labels'])]
+    changes = rng.sample(pool, min(params['changes'], len(pool)))
+    commits = max(1, params['commits'])
+    batches = [changes[number::commits] for number in range(commits)]
+    # a class edited in the first commit and renamed in the last one,
+    # git diff reports it as a single rename to the new name
+    renamed = next((component for component in components if component[0] == 'ApexClass'
+                    and ('component', component) not in changes), None)
+    expected = {}
+    if params['shape'] == 'merge':
+        main_branch = git(repo, 'rev-parse', '--abbrev-ref', 'HEAD')
+        git(repo, 'checkout', '-q', '-b', 'feature')
+    for number, batch in enumerate(batches, start=1):
+        if params['shape'] == 'merge' and number == len(batches):
+            # the last batch lands on the main branch, then the feature branch is merged
+            git(repo, 'checkout', '-q', main_branch)
+        for kind, change in batch:
+            if kind == 'label':
+                label_revisions[change] = number
+                expected.setdefault('CustomLabel', set()).add(f'Label_{change}')
+            else:
+                write_component(repo, change, number)
+                expected.setdefault(change[0], set()).add(change[1])
+        if number == 1 and renamed is not None:
+            write_component(repo, renamed, number)
+        write_file(repo, label_file, labels_source(label_revisions))
+        git(repo, 'add', '-A')
+        if params['shape'] == 'single':
+            continue
+        git(repo, 'commit', '-q', '-m', f'change {number}')
+    if renamed is not None:
+        expected.setdefault('ApexClass', set()).add(rename_class(repo, renamed))
+        if params['shape'] != 'single':
+            git(repo, 'commit', '-q', '-m', 'rename')
+    if params['shape'] == 'single':
+        git(repo, 'commit', '-q', '-m', 'changes')
+    elif params['shape'] == 'merge':
+        git(repo, 'merge', '-q', '--no-ff', '-m', 'merge feature', 'feature')
+    to_ref = git(repo, 'rev-parse', 'HEAD')
+    return from_ref, to_ref, expected
+
+
+def run_once(repo, from_ref, to_ref, mode, cache_dir, metrics_file):
+    """
+        Run create_delta_package.main once in the repo,
+        or batch_delta.main on the same range in batch mode.
+        Returns the seconds of each stage and the members of the delta.
+    """
+    open(metrics_file, 'w', encoding='utf-8').close()
+    if mode == 'cache_cold':
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    delta = os.path.join(repo, 'delta.xml')
+    json_file = os.path.join(repo, 'sfdx-project.json')
+    with metrics.stage('create_delta_package'):
+        if mode == 'batch':
+            ranges_file = os.path.join(repo, 'ranges.txt')
+            with open(ranges_file, 'w', encoding='utf-8') as file:
+                file.write(f'{from_ref} {to_ref}\n')
+            batch_delta.main(ranges_file, None, json_file, delta, None)
+        else:
+            create_delta_package.main(from_ref, to_ref, json_file, delta, None,
+                                      stream=mode == 'stream',
+                                      cache_dir=cache_dir if mode.startswith('cache') else None)
+    stages = {}
+    with open(metrics_file, encoding='utf-8') as file:
+        for line in file:
+            record = json.loads(line)
+            stages[record['stage']] = stages.get(record['stage'], 0) + record['seconds']
+    changes, _stats = manifest_merge.merge_manifests([delta])
+    return stages, changes
+
+
+def run_mode(repo, from_ref, to_ref, mode, repeat, expected):
+    """
+        Run a mode repeat times and return the median seconds of each stage
+        and whether every delta matched the expected members.
+    """
+    cache_dir = os.path.join(repo, '.sfci-cache')
+    metrics_file = os.path.join(repo, 'metrics.jsonl')
+    if mode == 'cache_warm':
+        run_once(repo, from_ref, to_ref, 'cache_cold', cache_dir, metrics_file)
+    runs = []
+    correct = True
+    for _ in range(repeat):
+        stages, changes = run_once(repo, from_ref, to_ref, mode, cache_dir, metrics_file)
+        runs.append(stages)
+        if changes != expected:
+            correct = False
+            for type_name in sorted(set(changes) | set(expected)):
+                missing = expected.get(type_name, set()) - changes.get(type_name, set())
+                extra = changes.get(type_name, set()) - expected.get(type_name, set())
+                if missing or extra:
+                    logging.warning('%s %s: %s missing, %s unexpected',
+                                    mode, type_name, len(missing), len(extra))
+    medians = {stage: statistics.median(run.get(stage, 0) for run in runs)
+               for stage in STAGES}
+    return {'stages': medians, 'correct': correct}
+
+
+def log_results(results, previous=None):
+    """
+        Log the stage table of each mode, with the change
+        against the previous results if any.
+    """
+    logging.info('%-12s %-22s %10s %10s', 'MODE', 'STAGE', 'SECONDS', 'CHANGE')
+    for mode, result in results['modes'].items():
+        for stage in STAGES:
+            seconds = result['stages'][stage]
+            change = ''
+            try:
+                before = previous['modes'][mode]['stages'][stage]
+                if before:
+                    change = f'{(seconds - before) / before:+.1%}'
+            except (KeyError, TypeError):
+                pass
+            logging.info('%-12s %-22s %10.4f %10s', mode, stage, seconds, change)
+        if not result['correct']:
+            logging.info('%-12s delta does not match the expected members', mode)
+
+
+def main(params, repeat, output, compare, keep):
+    """
+        Main function to run the benchmark.
+    """
+    rng = random.Random(params['seed'])
+    repo = tempfile.mkdtemp(prefix='benchmark_delta_')
+    working_dir = os.getcwd()
+    try:
+        start = time.perf_counter()
+        from_ref, to_ref, expected = create_repo(repo, params, rng)
+        logging.info('Generated repo in %.1fs: %s changed components',
+                     time.perf_counter() - start,
+                     sum(len(members) for members in expected.values()))
+        # the delta scripts run git and read files relative to the working directory
+        os.chdir(repo)
+        metrics.configure(os.path.join(repo, 'metrics.jsonl'))
+        root_logger = logging.getLogger()
+        level = root_logger.level
+        root_logger.setLevel(logging.WARNING)
+        try:
+            results = {'params': params, 'repeat': repeat,
+                       'python': sys.version.split()[0], 'time': time.time(),
+                       'modes': {mode: run_mode(repo, from_ref, to_ref, mode, repeat, expected)
+                                 for mode in MODES}}
+        finally:
+            root_logger.setLevel(level)
+    finally:
+        os.chdir(working_dir)
+        if keep:
+            logging.info('Repo kept in %s', repo)
+        else:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    previous = None
+    if compare:
+        with open(compare, encoding='utf-8') as file:
+            previous = json.load(file)
+        if previous.get('params') != params:
+            logging.warning('WARNING: %s was run with other parameters', compare)
+    log_results(results, previous)
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+        logging.info('Results saved to %s', output)
+    return 0 if all(result['correct'] for result in results['modes'].values()) else 1
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    sys.exit(main({'classes': inputs.classes, 'objects': inputs.objects,
+                   'fields': inputs.fields, 'labels': inputs.labels,
+                   'reports': inputs.reports, 'changes': inputs.changes,
+                   'commits': inputs.commits, 'shape': inputs.shape,
+                   'seed': inputs.seed},
+                  inputs.repeat, inputs.output, inputs.compare, inputs.keep))
@@ -0,0 +1,132 @@
+"""
+    Benchmark of the streaming manifest merge engine against
+    the full ElementTree parse previously used by parse_manual_package.
+    Both keep the merged result, so the peak is dominated by it; the parse
+    overhead (peak minus the result) shows what each parser holds while
+    reading. Use large manifests to see it, e.g.
+    python ./benchmark_manifest_merge.py --manifests 4 --members 300000
+"""
+import argparse
+import logging
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+# import local scripts
+import manifest_merge
+import metadata_types
+
+# format logger
+logging.basicConfig(format='%(message)s', level=logging.INFO)
+ns = {'sforce': 'http://soap.sforce.com/2006/04/metadata'}
+
+
+def parse_args():
+    """
+        Function to parse required arguments.
+        manifests - number of package.xml files to merge
+        members - number of members in each package.xml
+        seed - random seed used to build the manifests
+    """
+    parser = argparse.ArgumentParser(description='A script to benchmark the manifest merge.')
+    parser.add_argument('-n', '--manifests', type=int, default=1000)
+    parser.add_argument('-m', '--members', type=int, default=200)
+    parser.add_argument('-s', '--seed', type=int, default=42)
+    args = parser.parse_args()
+    return args
+
+
+def full_parse_manifest(package_path, changes):
+    """
+        Full parse with a regex per member, as parse_manual_package
+        did before the merge engine.
+    """
+    root = ET.parse(package_path).getroot()
+    for metadata_type in root.findall('sforce:types', ns):
+        metadata_name = (metadata_type.find('sforce:name', ns)).text
+        for metadata_member in metadata_type.findall('sforce:members', ns):
+            wildcard = re.search(r'\*', metadata_member.text)
+            if metadata_name is not None and wildcard is None and len(metadata_name.strip()) > 0:
+                changes.setdefault(metadata_name, set()).add(metadata_member.text)
+    return changes
+
+
+def write_manifests(folder, count, members, seed):
+    """
+        Write synthetic package.xml files with overlapping members.
+    """
+    rng = random.Random(seed)
+    type_names = sorted(set(metadata_types.metadata_Types.values()))
+    paths = []
+    for number in range(count):
+        items = {}
+        for _ in range(members):
+            items.setdefault(rng.choice(type_names), set()).add(f'Member{rng.randrange(20000)}')
+        if number % 100 == 0:
+            items.setdefault('ApexClass', set()).add('*')
+        path = f'{folder}/package_{number}.xml'
+        with open(path, 'w', encoding='utf-8') as package_file:
+            package_file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                               f'<Package xmlns="{ns["sforce"]}">\n')
+            for type_name, type_members in items.items():
+                package_file.write('\t<types>\n')
+                for member in type_members:
+                    package_file.write(f'\t\t<members>{member}</members>\n')
+                package_file.write(f'\t\t<name>{type_name}</name>\n\t</types>\n')
+            package_file.write('\t<version>58.0</version>\n</Package>\n')
+        paths.append(path)
+    return paths
+
+
+def full_parse_manifests(paths):
+    """
+        Merge every manifest with the full parse.
+    """
+    changes = {}
+    for path in paths:
+        full_parse_manifest(path, changes)
+    return changes
+
+
+def measure(function, paths):
+    """
+        Return the elapsed seconds, peak traced memory, parse overhead and
+        result of the merge. The overhead is the peak minus the memory still
+        held by the result, i.e. what the parser kept while reading.
+        Memory is traced in a second run so it doesn't slow down the timing.
+    """
+    start = time.perf_counter()
+    result = function(paths)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    _traced = function(paths)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, peak - retained, result
+
+
+def main(manifests, members, seed):
+    """
+        Main function to run the benchmark.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_manifests(folder, manifests, members, seed)
+        full_time, full_peak, full_overhead, full_changes = measure(full_parse_manifests, paths)
+        merge_time, merge_peak, merge_overhead, (changes, stats) = measure(
+            manifest_merge.merge_manifests, paths)
+
+    logging.info('Manifests merged: %s (%s members each)', manifests, members)
+    logging.info('Full parse:   %.3fs, peak %.1f MB, parse overhead %.1f MB',
+                 full_time, full_peak / 2 ** 20, full_overhead / 2 ** 20)
+    logging.info('Merge engine: %.3fs, peak %.1f MB, parse overhead %.1f MB',
+                 merge_time, merge_peak / 2 ** 20, merge_overhead / 2 ** 20)
+    logging.info('Duplicates: %s, wildcards: %s', stats['duplicates'], len(stats['wildcards']))
+    logging.info('Same result: %s', changes == full_changes)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    main(inputs.manifests, inputs.members, inputs.seed)
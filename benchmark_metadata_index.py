@@ -0,0 +1,123 @@
+"""
+    Micro-benchmark of the precompiled metadata index against
+    the linear scan previously used by find_component_type.
+    python ./benchmark_metadata_index.py --count 100000
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import time
+
+# import local scripts
+import metadata_index
+import metadata_types
+
+# format logger
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+
+def parse_args():
+    """
+        Function to parse required arguments.
+        count - number of synthetic paths to resolve
+        seed - random seed used to build the paths
+    """
+    parser = argparse.ArgumentParser(description='A script to benchmark the metadata index.')
+    parser.add_argument('-c', '--count', type=int, default=100000)
+    parser.add_argument('-s', '--seed', type=int, default=42)
+    args = parser.parse_args()
+    return args
+
+
+def linear_find_component_type(file_path):
+    """
+        Linear scan over every metadata type, as find_component_type
+        did before the index. Files inside_File are not parsed.
+    """
+    base_name = os.path.basename(file_path)
+    name_ext = os.path.splitext(base_name)
+    subdirname = os.path.basename(os.path.dirname(file_path))
+
+    component_type = ''
+    member = ''
+
+    for keyvalue in metadata_types.metadata_Types.items():
+        key = keyvalue[0]
+        search_for = '/' + key + '/'
+        if search_for in file_path:
+            component_type = metadata_types.metadata_Types[key]
+            member = (name_ext[0].split('.')[0],)
+        if component_type in metadata_types.inside_Folder:
+            member = (subdirname + os.sep + name_ext[0].split('.')[0],)
+        if component_type in metadata_types.has_child_Items:
+            for child_types in metadata_types.has_child_Items[component_type]:
+                if child_types.get(subdirname):
+                    component_type = child_types[subdirname]
+                    parent_object = re.search(fr"{search_for}(\w+)/", file_path).group(1)
+                    member = (f'{parent_object}.{member[0]}',)
+                    break
+    return (component_type, member)
+
+
+def build_paths(count, seed):
+    """
+        Build synthetic source paths covering plain, folder
+        and child metadata types plus some non-metadata files.
+    """
+    rng = random.Random(seed)
+    root = 'force-app/main/default'
+    directories = [key for key, value in metadata_types.metadata_Types.items()
+                   if value not in metadata_types.inside_File]
+    child_dirs = [directory for child in metadata_types.has_child_Items['CustomObject']
+                  for directory in child]
+    folder_dirs = [key for key, value in metadata_types.metadata_Types.items()
+                   if value in metadata_types.inside_Folder]
+    paths = []
+    for number in range(count):
+        shape = rng.random()
+        if shape < 0.3:
+            directory = rng.choice(child_dirs)
+            paths.append(f'{root}/objects/Object{number % 500}__c/{directory}/'
+                         f'Item{number}.{directory}-meta.xml')
+        elif shape < 0.4:
+            directory = rng.choice(folder_dirs)
+            paths.append(f'{root}/{directory}/Folder{number % 50}/Item{number}.meta.xml')
+        elif shape < 0.95:
+            directory = rng.choice(directories)
+            paths.append(f'{root}/{directory}/Item{number}.{directory}-meta.xml')
+        else:
+            paths.append(f'scripts/tools/file{number}.py')
+    return paths
+
+
+def time_function(function, paths):
+    """
+        Resolve every path and return the elapsed seconds and results.
+    """
+    start = time.perf_counter()
+    results = [function(path) for path in paths]
+    return time.perf_counter() - start, results
+
+
+def main(count, seed):
+    """
+        Main function to run the benchmark.
+    """
+    paths = build_paths(count, seed)
+    linear_time, linear_results = time_function(linear_find_component_type, paths)
+    index_time, index_results = time_function(metadata_index.resolve, paths)
+
+    mismatches = sum(1 for old, new in zip(linear_results, index_results) if old != new)
+    logging.info('Paths resolved: %s', count)
+    logging.info('Linear scan: %.3fs (%.2f us/path)', linear_time, linear_time / count * 1e6)
+    logging.info('Index:       %.3fs (%.2f us/path)', index_time, index_time / count * 1e6)
+    logging.info('Speedup:     %.1fx', linear_time / index_time)
+    logging.info('Mismatches:  %s', mismatches)
+    return mismatches
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    main(inputs.count, inputs.seed)
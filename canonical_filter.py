@@ -0,0 +1,205 @@
+"""
+    Drop format-only changes from the delta.
+    The old and new blobs of each modified file are hashed after normalizing
+    their content: XML in canonical form (sorted attributes, no comments,
+    no whitespace-only text between elements), Apex without comments or whitespace
+    between tokens. Files with the same hash on both sides are dropped.
+    Hashes are cached by blob SHA under .sfci-cache/.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import xml.etree.ElementTree as ET
+
+# import local scripts
+import metadata_index
+import metrics
+
+CACHE_FILE = os.path.join('.sfci-cache', 'canonical_hashes.json')
+# bump when the normalization changes so cached hashes are dropped
+CANONICAL_VERSION = 2
+# git uses the zero SHA for files of the working tree
+ZERO_SHA = '0' * 40
+APEX_EXTENSIONS = ('.cls', '.trigger')
+XML_EXTENSIONS = ('.xml',)
+# string literals are kept as one token, comments are dropped
+apex_token_pattern = re.compile(r"'(?:\\.|[^'\\\n])*'|//[^\n]*|/\*.*?\*/|\w+|\S", re.S)
+
+
+class BlobReader(object):
+    """
+        Class to read blobs through a single git cat-file --batch process.
+    """
+    def __init__(self):
+        self.process = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, sha):
+        """
+            Return the content of the blob, or None if it is missing.
+        """
+        self.process.stdin.write(sha.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+        # <sha> <type> <size> or <sha> missing
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            return None
+        content = self.process.stdout.read(int(header[2]))
+        # each blob is followed by a line feed
+        self.process.stdout.read(1)
+        return content
+
+    def close(self):
+        """
+            Close the git process.
+        """
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def canonical_apex(content):
+    """
+        Normalize Apex source: comments and whitespace between tokens are dropped.
+    """
+    text = content.decode('utf-8', errors='surrogateescape')
+    tokens = [token for token in apex_token_pattern.findall(text)
+              if not token.startswith(('//', '/*'))]
+    return '\n'.join(tokens).encode('utf-8', errors='surrogateescape')
+
+
+def canonical_xml(content):
+    """
+        Normalize XML with C14N 2.0: attributes are sorted, comments dropped
+        and whitespace-only text between elements removed (indentation).
+        The text of the elements is kept as is, e.g. a trailing space in a
+        label value is a real change. Returns None if it isn't valid XML.
+    """
+    try:
+        # the default tree builder drops comments and the XML declaration
+        root = ET.fromstring(content.decode('utf-8'))
+    except (ET.ParseError, UnicodeDecodeError):
+        return None
+    for element in root.iter():
+        if len(element) and element.text and not element.text.strip():
+            element.text = None
+        if element.tail and not element.tail.strip():
+            element.tail = None
+    return ET.canonicalize(ET.tostring(root, encoding='unicode')).encode('utf-8')
+
+
+def canonical_hash(path, content):
+    """
+        Hash the normalized content of the file.
+        Returns None if the file type isn't normalized.
+    """
+    if path.endswith(APEX_EXTENSIONS):
+        canonical = canonical_apex(content)
+    elif path.endswith(XML_EXTENSIONS):
+        canonical = canonical_xml(content)
+    else:
+        return None
+    if canonical is None:
+        return None
+    return hashlib.sha1(canonical).hexdigest()
+
+
+def load_cache(cache_file=CACHE_FILE):
+    """
+        Function to read the cached hashes: blob SHA -> canonical hash.
+    """
+    try:
+        with open(cache_file, encoding='utf-8') as file:
+            cached = json.load(file)
+        if cached.get('version') == CANONICAL_VERSION:
+            return cached['hashes']
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def save_cache(hashes, cache_file=CACHE_FILE):
+    """
+        Function to write the cached hashes, replacing the file atomically.
+    """
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    temp_file = f'{cache_file}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump({'version': CANONICAL_VERSION, 'hashes': hashes}, file)
+    os.replace(temp_file, cache_file)
+
+
+def blob_hash(path, sha, reader, hashes):
+    """
+        Return the canonical hash of a blob, from the cache if possible.
+        Blobs of the working tree (zero SHA) are read from disk and not cached.
+    """
+    if sha != ZERO_SHA and sha in hashes:
+        return hashes[sha]
+    if sha == ZERO_SHA:
+        with open(path, 'rb') as file:
+            content = file.read()
+    else:
+        content = reader.read(sha)
+    if content is None:
+        return None
+    digest = canonical_hash(path, content)
+    if sha != ZERO_SHA and digest is not None:
+        hashes[sha] = digest
+    return digest
+
+
+def members(paths):
+    """
+        Function to list the (type, member) of the paths.
+    """
+    components = set()
+    for path in paths:
+        component_type, component_members = metadata_index.resolve(path)
+        components.update((component_type, member) for member in component_members)
+    return components
+
+
+def is_format_only(path, diffs, reader, hashes):
+    """
+        Function to check if a modified file only changed its formatting.
+    """
+    if diffs.status(path) != 'M' or not path.endswith(APEX_EXTENSIONS + XML_EXTENSIONS):
+        return False
+    old_sha, new_sha = diffs.blob_shas(path)
+    old_hash = blob_hash(path, old_sha, reader, hashes)
+    return old_hash is not None and old_hash == blob_hash(path, new_sha, reader, hashes)
+
+
+@metrics.timed(name='prune_format_changes')
+def prune_format_changes(file_list, diffs, cache_file=CACHE_FILE):
+    """
+        Function to drop the files whose old and new blobs have the same
+        canonical hash. diffs must be a streamed diff with blob SHAs.
+        Returns the files to keep.
+    """
+    hashes = load_cache(cache_file)
+    cached = len(hashes)
+    reader = BlobReader()
+    try:
+        kept, pruned = [], []
+        for path in file_list:
+            if is_format_only(path, diffs, reader, hashes):
+                pruned.append(path)
+            else:
+                kept.append(path)
+    finally:
+        reader.close()
+    if len(hashes) != cached:
+        save_cache(hashes, cache_file)
+
+    # a component is pruned if none of its files is left, e.g. the .cls of a class
+    pruned_components = members(pruned) - members(kept)
+    logging.info('Format-only changes: %s of %s files, %s components pruned',
+                 len(pruned), len(file_list), len(pruned_components))
+    for component_type, member in sorted(pruned_components):
+        logging.debug('  pruned %s %s', component_type, member)
+    return kept
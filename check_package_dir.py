@@ -2,6 +2,7 @@
     Install Salesforce CLI and append it to your environment path.
 """
 import argparse
+import functools
 import json
 import os
 import sys
@@ -67,12 +68,73 @@ def set_default_package_dir(directories):
     return source_folder
 
 
+def package_paths(json_file):
+    """
+        Function to return the path of every package directory.
+    """
+    parsed_json = load_project(os.path.abspath(json_file))
+    return [directory['path'] for directory in parsed_json.get('packageDirectories') or []]
+
+
+def split_path(path):
+    """
+        Function to split a path into folders, ignoring ./ and trailing slashes.
+    """
+    return [segment for segment in path.replace('\\', '/').split('/')
+            if segment and segment != '.']
+
+
+class PackageTrie(object):
+    """
+        Class to route file paths to their package directory.
+        Folders are matched whole, so force-app-old is not inside force-app.
+    """
+    def __init__(self, paths):
+        self.root = {}
+        for path in paths:
+            node = self.root
+            for segment in split_path(path):
+                node = node.setdefault(segment, {})
+            # None can't be a folder name, use it to mark the end of a package path
+            node[None] = path
+
+    def route(self, file_path):
+        """
+            Return the package path of the file (the deepest match) or None.
+        """
+        node = self.root
+        package = None
+        for segment in split_path(file_path)[:-1]:
+            node = node.get(segment)
+            if node is None:
+                break
+            package = node.get(None, package)
+        return package
+
+
+def load_project(json_path):
+    """
+        Function to parse the JSON file once per process, and again
+        when it is modified (e.g. during watch_delta.py).
+        The parsed dictionary is shared, don't modify it.
+    """
+    return parse_project(json_path, os.stat(json_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=16)
+def parse_project(json_path, _mtime_ns):
+    """
+        Function to parse the JSON file, cached by path and modification time.
+    """
+    with open(json_path, encoding='utf-8') as file:
+        return json.load(file)
+
+
 def main(json_file):
     """
         Main function to return the package directory path.
     """
-    with open(os.path.abspath(json_file), encoding='utf-8') as file:
-        parsed_json = json.load(file)
+    parsed_json = load_project(os.path.abspath(json_file))
 
     package_directories = parsed_json.get('packageDirectories')
 
@@ -0,0 +1,106 @@
+"""
+    On-disk cache of the resolved (component type, members) pairs per changed
+    container file (labels, workflows...), the other files resolve from their path.
+    Entries are keyed by (path, blob SHAs, metadata version) and stored in
+    SQLite under .sfci-cache/ with least-recently-used eviction.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+# import local scripts
+import container_children
+import metadata_index
+import metadata_types
+
+CACHE_DIR = '.sfci-cache'
+CACHE_FILE = 'classification.sqlite'
+MAX_ENTRIES = 100000
+
+
+def metadata_version():
+    """
+        Hash the modules which decide the classification.
+        Any change to metadata_types.py (or the resolvers)
+        produces a new version and invalidates the cache.
+    """
+    digest = hashlib.sha1()
+    for module in (metadata_types, metadata_index, container_children):
+        with open(module.__file__, 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+class ClassificationCache(object):
+    """
+        Class to store and look up classified files.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.version = metadata_version()
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS classifications ('
+                                'path TEXT, blob TEXT, version TEXT, '
+                                'component_type TEXT, members TEXT, last_used REAL, '
+                                'PRIMARY KEY (path, blob, version))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS last_used_idx '
+                                'ON classifications (last_used)')
+        # drop everything classified with another metadata version
+        self.connection.execute('DELETE FROM classifications WHERE version != ?',
+                                (self.version,))
+
+    def get(self, path, blob):
+        """
+            Return the cached list of (component type, members) or None.
+        """
+        row = self.connection.execute('SELECT component_type, members FROM classifications '
+                                      'WHERE path = ? AND blob = ? AND version = ?',
+                                      (path, blob, self.version)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute('UPDATE classifications SET last_used = ? '
+                                'WHERE path = ? AND blob = ? AND version = ?',
+                                (time.time(), path, blob, self.version))
+        return [(component_type, tuple(members))
+                for component_type, members in json.loads(row[1])]
+
+    def put(self, path, blob, result):
+        """
+            Store the list of (component type, members) of a file.
+            A container file can have children of several types.
+        """
+        self.connection.execute('INSERT OR REPLACE INTO classifications '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (path, blob, self.version,
+                                 ','.join(component_type for component_type, _members in result),
+                                 json.dumps([[component_type, list(members)]
+                                             for component_type, members in result]),
+                                 time.time()))
+
+    def evict(self):
+        """
+            Delete the least recently used entries above the size limit.
+        """
+        count = self.connection.execute('SELECT COUNT(*) FROM classifications').fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute('DELETE FROM classifications WHERE rowid IN '
+                                    '(SELECT rowid FROM classifications '
+                                    'ORDER BY last_used LIMIT ?)',
+                                    (count - self.max_entries,))
+
+    def close(self):
+        """
+            Evict, save and close the cache.
+        """
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+        logging.info('Classification cache: %s hits, %s misses', self.hits, self.misses)
@@ -0,0 +1,218 @@
+"""
+    Map the diff of a container file (CustomLabels, Workflow, SharingRules...)
+    to the changed child members, using the metadata_types.inside_File table.
+    The container is read once to find the line range of each child,
+    then every changed line of the diff is matched by line number.
+    Trimmed containers with only the changed children can be written
+    to make the deploy payload smaller.
+"""
+import bisect
+import logging
+import os
+import re
+import subprocess
+from xml.parsers import expat
+
+# import local script
+import metadata_types
+
+# hunk header of a unified diff, e.g. @@ -10,7 +10,8 @@
+hunk_pattern = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+
+
+def read_file(file_path, to_ref=None):
+    """
+        Read the file from the to_ref commit.
+        Falls back to the working tree if to_ref is not set.
+    """
+    if to_ref:
+        output = subprocess.run(['git', 'show', f'{to_ref}:{file_path}'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                check=True)
+        return output.stdout
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+
+class ContainerIndex(object):
+    """
+        Class to hold the line range and (element, full name)
+        of every direct child of the container root,
+        sorted by their first line.
+    """
+    def __init__(self, content):
+        self.starts, self.ends, self.children = [], [], []
+        # first and last line of the root element
+        self.root = [None, None]
+        # current child as [start line, element, full name], text of the current element
+        state = {'child': None, 'text': [], 'depth': 0}
+        parser = expat.ParserCreate(namespace_separator=' ')
+
+        def start_element(name, _attributes):
+            state['depth'] += 1
+            if state['depth'] == 1:
+                self.root[0] = parser.CurrentLineNumber
+            elif state['depth'] == 2:
+                state['child'] = [parser.CurrentLineNumber, name.split(' ')[-1], None]
+            state['text'] = []
+
+        def end_element(name):
+            tag = name.split(' ')[-1]
+            if state['depth'] == 1:
+                self.root[1] = parser.CurrentLineNumber
+            elif state['depth'] == 2:
+                self.starts.append(state['child'][0])
+                self.ends.append(parser.CurrentLineNumber)
+                self.children.append((state['child'][1], state['child'][2]))
+                state['child'] = None
+            elif state['depth'] == 3 and tag == 'fullName':
+                state['child'][2] = ''.join(state['text']).strip()
+            state['depth'] -= 1
+
+        def character_data(data):
+            state['text'].append(data)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+        parser.Parse(content, True)
+
+    def find(self, line):
+        """
+            Return the position of the child which contains the line, or None.
+        """
+        position = bisect.bisect_right(self.starts, line) - 1
+        if position >= 0 and line <= self.ends[position]:
+            return position
+        return None
+
+
+def changed_lines(file_diff):
+    """
+        Generator which yields the first and last line numbers (in the new file)
+        touched by each changed line of the diff. A removed line yields the
+        lines around it, so that it only counts when it was inside a single child.
+    """
+    new_line = None
+    for line in file_diff.split('\n'):
+        match = hunk_pattern.match(line)
+        if match:
+            new_line = int(match.group(1))
+        elif new_line is None:
+            # file header before the first hunk
+            continue
+        elif line.startswith('+'):
+            yield (new_line, new_line)
+            new_line += 1
+        elif line.startswith('-'):
+            yield (new_line - 1, new_line)
+        elif line.startswith(' '):
+            new_line += 1
+
+
+def child_member(component_type, container_member, name):
+    """
+        Name a child after its container, e.g. Account.Rule_1,
+        unless the container type has global children (labels).
+    """
+    if component_type in metadata_types.global_Children:
+        return name
+    return f'{container_member}.{name}'
+
+
+def changed_children(index, file_diff):
+    """
+        Function to find the positions of the children changed by the diff,
+        in the diff order. Lines added between the children are ignored.
+        Returns None if lines were removed outside a single child,
+        e.g. a whole child was deleted.
+    """
+    positions = {}
+    for first, last in changed_lines(file_diff):
+        position = index.find(first)
+        if position is not None and position == index.find(last):
+            positions[position] = None
+        elif first != last:
+            return None
+    return list(positions)
+
+
+def parse_container(file_path, component_type, container_member, diffs, to_ref=None):
+    """
+        Parse the container file and find the children with changes.
+        Returns a list of (child type, members) pairs, or the whole
+        container if a change is outside the children listed in the table.
+        The file is read from to_ref, or the current working directory
+        if to_ref is not set.
+    """
+    child_types = metadata_types.inside_File[component_type]
+    try:
+        index = ContainerIndex(read_file(file_path, to_ref))
+    except (OSError, subprocess.CalledProcessError, expat.ExpatError) as exception:
+        # e.g. a deleted container, it can't be split
+        logging.debug('Deploying the whole %s %s: %s', component_type, container_member, exception)
+        return [(component_type, (container_member,))]
+
+    positions = changed_children(index, diffs[file_path])
+    if not positions:
+        # e.g. a deleted child, which can't be deployed on its own
+        logging.debug('Deploying the whole %s %s: the change is outside its children',
+                      component_type, container_member)
+        return [(component_type, (container_member,))]
+    # dictionary keys remove duplicates and keep the diff order
+    members = {}
+    for position in positions:
+        tag, name = index.children[position]
+        child_type = child_types.get(tag)
+        if child_type is None or not name:
+            # the change is in a part of the container without its own type
+            return [(component_type, (container_member,))]
+        members.setdefault(child_type, {})[child_member(component_type,
+                                                        container_member, name)] = None
+    return [(child_type, tuple(names)) for child_type, names in members.items()]
+
+
+def write_trimmed(file_path, component_type, container_member, components,
+                  output_dir, to_ref=None):
+    """
+        Write a copy of the container under output_dir with only the
+        children listed in the components, so the deploy payload is smaller.
+        The whole file is copied if the container itself is listed.
+        Children are copied line by line, so each child must start on its own line.
+        Returns the written file, or None if the container can't be read
+        (e.g. it was deleted).
+    """
+    selected = components_keys(components)
+    try:
+        content = read_file(file_path, to_ref)
+        index = None
+        if (component_type, container_member) not in selected:
+            index = ContainerIndex(content)
+    except (OSError, subprocess.CalledProcessError, expat.ExpatError) as exception:
+        logging.debug('Not trimming %s %s: %s', component_type, container_member, exception)
+        return None
+    output_file = os.path.join(output_dir, file_path)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'wb') as file:
+        if index is None:
+            file.write(content)
+            return output_file
+        lines = content.splitlines(keepends=True)
+        child_types = metadata_types.inside_File[component_type]
+        # header up to the root start tag
+        file.writelines(lines[:index.root[0]])
+        for position, (tag, name) in enumerate(index.children):
+            member = (child_types.get(tag), child_member(component_type, container_member, name))
+            if member in selected:
+                file.writelines(lines[index.starts[position] - 1:index.ends[position]])
+        # root end tag and anything after it
+        file.writelines(lines[index.root[1] - 1:])
+    return output_file
+
+
+def components_keys(components):
+    """
+        Function to list the (type, member) of the components.
+    """
+    return {(component_type, member) for component_type, names in components
+            for member in names}
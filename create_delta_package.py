@@ -11,17 +11,23 @@ import re
 import subprocess
 
 # import local scripts
-import custom_labels
+import canonical_filter
 import check_package_dir
+import classification_cache
+import container_children
+import git_diff
+import manifest_chunker
 import merge_manual_package
+import metadata_index
 import metadata_types
-import package_template
+import metrics
+import package_writer
 
 # Format logging message
 logging.basicConfig(format='%(message)s', level=logging.DEBUG)
 
 
-def parse_args():
+def parse_args(argv=None):
     """
         Function to pass required arguments.
         from_ref - previous commit or baseline branch $CI_COMMIT_BEFORE_SHA
@@ -29,6 +35,20 @@ def parse_args():
         json - sfdx-project.json
         delta - delta file created by this script
         manifest - manual manifest file to merge with delta
+        stream - list changed paths first and fetch patches per file when needed
+        cache_dir - cache the classification of each changed blob in this folder
+            (implies stream), e.g. .sfci-cache
+        max_components - also split the delta into chunks of at most this many components
+            and write an index of the chunks (delta_chunks.json) for the deploy step
+        max_bytes - estimated payload size limit of each chunk
+        per_package - write one delta per package directory (delta_<package>.xml)
+            and a jobs file listing them (delta_packages.json) for the deploy step
+        canonical - drop modified Apex/XML files which only changed their formatting
+            (implies stream), their canonical hashes are cached in cache_dir
+        trimmed_dir - write a copy of each changed container file (workflows,
+            sharing rules, labels...) with only its changed children to this folder
+        metrics - append the timing of each stage to this JSON-lines file
+        profile - dump the cProfile stats of the run to this file
     """
     parser = argparse.ArgumentParser(description='A script to generate the delta package.')
     parser.add_argument('-f', '--from_ref')
@@ -36,19 +56,36 @@ def parse_args():
     parser.add_argument('-j', '--json', default='./sfdx-project.json')
     parser.add_argument('-d', '--delta', default='delta.xml')
     parser.add_argument('-m', '--manifest', default='manifest/package.xml')
-    args = parser.parse_args()
+    parser.add_argument('-s', '--stream', default=False, action='store_true')
+    parser.add_argument('-c', '--cache_dir', default=None)
+    parser.add_argument('-n', '--max_components', type=int, default=None)
+    parser.add_argument('-b', '--max_bytes', type=int, default=manifest_chunker.MAX_BYTES)
+    parser.add_argument('-p', '--per_package', default=False, action='store_true')
+    parser.add_argument('--canonical', default=False, action='store_true')
+    parser.add_argument('--trimmed_dir', default=None)
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--profile', default=None)
+    args = parser.parse_args(argv)
     return args
 
 
-def take_git_diff(from_ref, to_ref):
+# the diff is path -> patch text, so count the changed files
+@metrics.timed(count=len)
+def take_git_diff(from_ref, to_ref, stream=False):
     """
         Function to take the diff and create
         a dictionary of changes.
+        In stream mode, only the changed paths are read up front and
+        the patch of a file is fetched from git when it is looked up,
+        so memory does not grow with the size of the diff.
     """
+    if stream:
+        return git_diff.GitDiffStream(from_ref, to_ref)
+
     # Take the diff and store the output
-    command = f'git diff {from_ref}..{to_ref}'
+    command = ['git', 'diff', f'{from_ref}..{to_ref}']
     output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True,
-                            check=True, shell=True)
+                            check=True)
 
     # Split the output into a list of file diffs
     file_diffs = output.stdout.strip().split('diff --git ')
@@ -64,129 +101,171 @@ def take_git_diff(from_ref, to_ref):
     return changed_files
 
 
+def route_metadata_files(changed_files, json_file):
+    """
+        Route each changed file to its package directory with a
+        path-prefix trie built from every packageDirectories entry.
+        Returns package path -> list of files, files outside
+        the package directories are dropped.
+    """
+    trie = check_package_dir.PackageTrie(check_package_dir.package_paths(json_file))
+    packages = {}
+    # iterate over the keys only so streamed diffs don't fetch every patch
+    for change_file in changed_files:
+        package = trie.route(change_file)
+        if package is not None:
+            packages.setdefault(package, []).append(change_file)
+    return packages
+
+
+@metrics.timed()
 def find_metadata_files(changed_files, json_file):
     """
-        Determine metadata source folder with other script
-        and then confirm changed files are inside that path
-    """
-    source_folder = check_package_dir.main(json_file)
-    metadata_changes = []
-    for change_file in changed_files.items():
-        # if source folder is in the key, append the file
-        if source_folder in change_file[0]:
-            metadata_changes.append(change_file[0])
-    return metadata_changes
-
-
-def find_component_type(file_path, diffs):
-    """
-        Find the component type using 
-        the imported dictionary
-    """
-    #dir_name = os.path.dirname(file_path)
-    base_name = os.path.basename(file_path)
-    # split base name by name and extension
-    # not using "name, ext = os.path.splittext" since we
-    # don't need to use the file extension at the moment
-    name_ext = os.path.splitext(base_name)
-    subdirname = os.path.basename(os.path.dirname(file_path))
-
-    component_type = ''
-    member = ''
-
-    # iterate through all keys in the dictionary
-    # using .items() to remove Pylint suggestion over .keys()
-    # "consider-using-dict-items / C0206 - Consider iterating with .items()"
-    for keyvalue in metadata_types.metadata_Types.items():
-        key = keyvalue[0]
-        search_for = '/' + key + '/'
-        if search_for in file_path:
-            component_type = metadata_types.metadata_Types[key]
-            member = (name_ext[0].split('.')[0],)
-        # Include the parent folder for specific items
-        if component_type in metadata_types.inside_Folder:
-            member =  (subdirname + os.sep + name_ext[0].split('.')[0],)
-        # If the component type has child items, check if metadata falls under
-        # the child item and overwrite the component type if it does
-        if component_type in metadata_types.has_child_Items:
-            for child_types in metadata_types.has_child_Items[component_type]:
-                if child_types.get(subdirname):
-                    component_type = child_types[subdirname]
-                    # find the parent object to append to member name
-                    parent_object = re.search(fr"{search_for}(\w+)/", file_path).group(1)
-                    member = (f'{parent_object}.{member[0]}',)
-                    break
-        # Check inside the file for specific items
-        if component_type in metadata_types.inside_File:
-            component_type, member = custom_labels.parse_custom_labels(file_path, diffs)
-    return (component_type, member)
-
-
-def build_type_items(file_list, diffs):
+        Confirm the package directories in the JSON file are valid
+        and return the changed files inside any of them.
+    """
+    check_package_dir.main(json_file)
+    packages = route_metadata_files(changed_files, json_file)
+    return [change_file for files in packages.values() for change_file in files]
+
+
+def package_delta_file(delta, package):
+    """
+        Name the delta file of a package, e.g. delta_force-app.xml
+    """
+    base, ext = os.path.splitext(delta)
+    package_name = re.sub(r'[^\w.-]+', '_', '_'.join(check_package_dir.split_path(package)))
+    return f'{base}_{package_name}{ext}'
+
+
+def find_components(file_path, diffs, cache=None, to_ref=None):
+    """
+        Find the component type using
+        the precompiled metadata index.
+        Container files which need parsing are read from to_ref
+        and return a (type, members) pair per changed child type.
+        Only containers are cached: other files resolve from their
+        path alone, which is cheaper than a cache lookup.
+    """
+    component_type, member = metadata_index.resolve(file_path)
+    if component_type not in metadata_types.inside_File:
+        return [(component_type, member)]
+
+    # the cache is keyed by blob SHAs, which only the streamed diff has
+    blob = None
+    if cache is not None and hasattr(diffs, 'blob_shas'):
+        blob = '..'.join(diffs.blob_shas(file_path))
+        cached = cache.get(file_path, blob)
+        if cached is not None:
+            return cached
+
+    # Check inside the file for specific items
+    components = container_children.parse_container(file_path, component_type, member[0],
+                                                    diffs, to_ref)
+    if blob is not None:
+        cache.put(file_path, blob, components)
+    return components
+
+
+@metrics.timed()
+def build_type_items(file_list, diffs, cache=None, to_ref=None, trimmed_dir=None):
     """
         Build type items.
+        Changed container files are copied to trimmed_dir
+        with only their changed children, if set.
     """
     changed = {}
     for filename in file_list:
-        (component_type, member) = find_component_type(filename, diffs)
-        if (component_type is not None and len(component_type.strip()) > 0) :
-            # if member tuple is greater than 1, add the first 1 by setting the type
-            # then, add the remaining items
-            if len(member) > 1:
-                changed.update({component_type : set()})
-                changed[component_type].add(member[0])
-                for member_item in member[1:]:
-                    changed[component_type].add(member_item)
-            elif component_type in changed and changed[component_type] is not None:
-                for member_item in member:
-                    changed[component_type].add(member_item)
-            else:
-                for member_item in member:
-                    changed.update({component_type : set()})
-                    changed[component_type].add(member_item)
+        components = find_components(filename, diffs, cache, to_ref)
+        for component_type, member in components:
+            # types without members (ex: labels file with no label changed) are skipped
+            if component_type is not None and len(component_type.strip()) > 0 and member:
+                changed.setdefault(component_type, set()).update(member)
+        if trimmed_dir:
+            container_type, container_member = metadata_index.resolve(filename)
+            if container_type in metadata_types.inside_File and components:
+                container_children.write_trimmed(filename, container_type, container_member[0],
+                                                 components, trimmed_dir, to_ref)
     return changed
 
 
-def create_package_xml(items, delta_file):
+def write_delta(changed, delta, manifest, max_components, max_bytes, json_file):
     """
-        Create the package.xml file
+        Merge the manual package.xml, if any, and write the delta file
+        (and its chunks if max_components is set).
     """
-    # Initialize the package contents with the header
-    package_contents = package_template.PKG_HEADER
-
-    # Append each item to the package
-    #    <types>
-    #       <name>ApexClass</name>
-    #       <members>ProjectTaskTriggerHandler</members>
-    #    </types>
-    for key in items:
-        package_contents += "\t<types>\n"
-        for member in items[key]:
-            package_contents += "\t\t<members>" + member + "</members>\n"
-        package_contents += "\t\t<name>" + key + "</name>\n"
-        package_contents += "\t</types>\n"
-    # Append the footer to the package
-    package_contents += package_template.PKG_FOOTER
-    logging.info('Auto-generated delta package:')
-    logging.info(package_contents)
-    with open(delta_file, 'w', encoding='utf-8') as package_file:
-        package_file.write(package_contents)
+    # merge manual package.xml if required
+    if manifest:
+        changed = merge_manual_package.parse_manual_package(manifest, changed)
+    package_writer.create_package_xml(changed, delta, json_file)
+    # split large deltas into deploy batches
+    if max_components:
+        manifest_chunker.write_chunks(changed, delta, max_components, max_bytes, json_file)
 
 
-def main(source, to_ref, json_file, delta, manifest):
+def main(source, to_ref, json_file, delta, manifest, stream=False, cache_dir=None,
+         max_components=None, max_bytes=manifest_chunker.MAX_BYTES, per_package=False,
+         canonical=False, trimmed_dir=None):
     """
         Main function to take the diff and
         build the package.xml file.
     """
-    updated_files = take_git_diff(source, to_ref)
-    metadata_files = find_metadata_files(updated_files, json_file)
-    changed = build_type_items(metadata_files, updated_files)
-    # merge manual package.xml if required
-    changed = merge_manual_package.parse_manual_package(manifest, changed)
-    create_package_xml(changed, delta)
+    cache = None
+    canonical_cache = canonical_filter.CACHE_FILE
+    if cache_dir:
+        cache = classification_cache.ClassificationCache(cache_dir)
+        canonical_cache = os.path.join(cache_dir, os.path.basename(canonical_filter.CACHE_FILE))
+        stream = True
+    # the canonical filter compares the blob SHAs of the streamed diff
+    if canonical:
+        stream = True
+    updated_files = take_git_diff(source, to_ref, stream)
+    if not per_package:
+        metadata_files = find_metadata_files(updated_files, json_file)
+        if canonical:
+            metadata_files = canonical_filter.prune_format_changes(metadata_files, updated_files,
+                                                                   canonical_cache)
+        changed = build_type_items(metadata_files, updated_files, cache, to_ref, trimmed_dir)
+        write_delta(changed, delta, manifest, max_components, max_bytes, json_file)
+    else:
+        default_package = check_package_dir.main(json_file)
+        packages = route_metadata_files(updated_files, json_file)
+        if canonical:
+            kept = set(canonical_filter.prune_format_changes(
+                [path for files in packages.values() for path in files],
+                updated_files, canonical_cache))
+            packages = {package: [path for path in files if path in kept]
+                        for package, files in packages.items()}
+        packages.setdefault(default_package, [])
+        jobs = []
+        for package, metadata_files in packages.items():
+            changed = build_type_items(metadata_files, updated_files, cache, to_ref,
+                                       trimmed_dir)
+            package_delta = package_delta_file(delta, package)
+            # the manual package.xml is deployed with the default package
+            write_delta(changed, package_delta,
+                        manifest if package == default_package else None,
+                        max_components, max_bytes, json_file)
+            jobs.append({'package': package, 'manifest': package_delta})
+        jobs_file = f'{os.path.splitext(delta)[0]}_packages.json'
+        with open(jobs_file, 'w', encoding='utf-8') as file:
+            json.dump(jobs, file, indent=4)
+        logging.info('Wrote %s package deltas, see %s', len(jobs), jobs_file)
+    if cache is not None:
+        cache.close()
+
+
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+    """
+    metrics.configure(inputs.metrics)
+    with metrics.profiled(inputs.profile), metrics.stage('create_delta_package'):
+        main(inputs.from_ref, inputs.to_ref,
+             inputs.json, inputs.delta, inputs.manifest, inputs.stream,
+             inputs.cache_dir, inputs.max_components, inputs.max_bytes,
+             inputs.per_package, inputs.canonical, inputs.trimmed_dir)
 
 
 if __name__ == '__main__':
-    inputs = parse_args()
-    main(inputs.from_ref, inputs.to_ref,
-         inputs.json, inputs.delta, inputs.manifest)
+    run(parse_args())
@@ -1,47 +1,64 @@
 """
-    Import ElementTree to parse the custom labels file
+    Map the diff of the custom labels file to the changed labels.
+    The labels are found by container_children.py, like the children
+    of the other container types.
 """
-import re
-import xml.etree.ElementTree as ET
+import argparse
+
+# import local scripts
+import container_children
+import git_diff
 
-# register the namespace to search the XML
-ns = {'sforce': 'http://soap.sforce.com/2006/04/metadata'}
 #filepath = 'force-app\main\default\labels\CustomLabels.labels-meta.xml'
 
-def parse_custom_labels(label_file, diffs):
+
+def parse_args(argv=None):
+    """
+        Function to parse required arguments.
+        from_ref - previous commit or baseline branch
+        to_ref - current commit or new branch, the working tree if not set
+        file - custom labels file
+    """
+    parser = argparse.ArgumentParser(description='A script to list the changed custom labels.')
+    parser.add_argument('-f', '--from_ref')
+    parser.add_argument('-t', '--to_ref', default=None)
+    parser.add_argument('-l', '--file',
+                        default='force-app/main/default/labels/CustomLabels.labels-meta.xml')
+    args = parser.parse_args(argv)
+    return args
+
+
+def parse_custom_labels(label_file, diffs, to_ref=None):
     """
         Parse the custom labels file
         and find labels with changes.
-        Requires the current working directory file to be
-        the same as to_ref argument in the parent script.
+        The labels file is read from to_ref, or the current
+        working directory if to_ref is not set.
     """
-    label_diff = diffs[label_file]
-    diff_lines = label_diff.split('\n')
-    root = ET.parse(label_file).getroot()
     component_type = 'CustomLabel'
-    members = []
-    for line in diff_lines:
-        # space needed after + to not get the file name line the starts with +++
-        if line.startswith('+ '):
-            # can't get anything useful with label tag
-            if 'labels' in line:
-                continue
-            # add net new label
-            elif 'fullName' in line:
-                labelname = re.search(r'>(.*?)<', line, flags=0).group(1)
-                members.append(labelname)
-            # find corresponding full name label if another element changed
-            # doesn't matter if there are duplicates in this list
-            # creating the dictionary will remove duplicate entries
-            else:
-                elementname = re.search(r'<(.*?)>', line, flags=0).group(1)
-                textinside = re.search(r'>(.*?)<', line, flags=0).group(1)
-                parentelement = root.findall(f".//sforce:labels[sforce:{elementname}='{textinside}']", ns)
-                if parentelement is not None:
-                    try:
-                        members.append((parentelement[0].find('sforce:fullName', ns)).text)
-                    except IndexError:
-                        pass
-    # convert list to tuple
-    members = tuple(members)
+    components = container_children.parse_container(label_file, 'CustomLabels', 'CustomLabels',
+                                                    diffs, to_ref)
+    # convert to tuple
+    members = tuple(member for child_type, names in components
+                    if child_type == component_type for member in names)
     return component_type, members
+
+
+def main(from_ref, to_ref, label_file):
+    """
+        Main function to print the changed labels as a comma-separated list.
+    """
+    diffs = {label_file: git_diff.file_patch(from_ref, to_ref, label_file)}
+    _component_type, members = parse_custom_labels(label_file, diffs, to_ref)
+    print(','.join(members))
+
+
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+    """
+    main(inputs.from_ref, inputs.to_ref, inputs.file)
+
+
+if __name__ == '__main__':
+    run(parse_args())
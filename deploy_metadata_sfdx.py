@@ -2,28 +2,66 @@
     Install Salesforce CLI and append it to your environment path before running this script.
 """
 import argparse
+import json
 import logging
+import os
 import re
 import subprocess
 import sys
-import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# import local scripts
+import apex_test_index
+import async_deploy
+import extract_tests_from_mr
+import metrics
+import quick_deploy
+import test_history
 
 # format logger
 logging.basicConfig(format='%(message)s', level=logging.DEBUG)
 
 
-def parse_args():
+def parse_args(argv=None):
     """
         Function to parse required arguments.
         tests - required Apex tests to run against
         manifest - path to the package.xml file
         wait - number of minutes to wait for command to complete
         environment - Salesforce environment URL
-        log - deploy log where the output of this script is being written to
-            python ./deploy_metadata_sfdx.py --args | tee -a deploy_log.txt
-            -a flag required to append to file during run-time
+        log - deploy log, the script prints the sfdx output and appends it to
+            this file itself instead of a shell redirection
+            (do not tee the script output into the same file)
         validate - set to True to run validation only deployment (for quick deploys)
         debug - print command rather than run
+        jobs - JSON file of deploy jobs to run in parallel instead of a single deploy
+            [{"manifest": "delta_1.xml", "alias": "uat", "environment": "https://..."}]
+            or the chunk index written by create_delta_package with --targets
+        targets - comma-separated org aliases which each get every chunk of the index
+        concurrency - maximum number of deploys running at the same time
+        log_dir - folder for the log file of each job
+        alias - target org alias, if not the default username
+        async_deploy - submit the deployment without waiting, save its ID
+            to the state file and poll its status (up to wait minutes)
+        detach - with async_deploy, exit once the deployment is submitted
+        resume - poll the deployments saved in the state file which were not reported yet
+        state - state file of the submitted deployments
+        max_inflight - maximum number of submitted deployments not done yet (0 = no limit)
+        auto_tests - if no tests are given, run the test classes which reference
+            the ApexClass/ApexTrigger members of the manifest (apex_test_index.py)
+        json - sfdx-project.json, used to find the Apex source with auto_tests
+        commit_message - if no tests are given, take them from the Apex::...::Apex
+            section of this message ($CI_COMMIT_MESSAGE)
+        shards - split the tests into this many check-only deploys run in parallel,
+            balanced with the test duration history (test_history.py)
+        quick_deploy - deploy the saved validation of the same org, manifest, commit
+            and tests without running the tests again, if it is less than 10 days old
+            (successful validations are always saved)
+        commit - commit deployed, part of the quick deploy key ($CI_COMMIT_SHA)
+        quick_cache - file where the validations are saved
+        metrics - append the timing of each stage to this JSON-lines file
+        profile - dump the cProfile stats of the run to this file
     """
     parser = argparse.ArgumentParser(description='A script to authenticate to Salesforce.')
     parser.add_argument('-t', '--tests')
@@ -33,42 +71,79 @@ def parse_args():
     parser.add_argument('-l', '--log', default='deploy_log.txt')
     parser.add_argument('-v', '--validate', default=False, action='store_true')
     parser.add_argument('-d', '--debug', default=False, action='store_true')
-    args = parser.parse_args()
+    parser.add_argument('-j', '--jobs', default=None)
+    parser.add_argument('--targets', default=None)
+    parser.add_argument('-p', '--concurrency', type=int, default=4)
+    parser.add_argument('--log_dir', default='deploy_logs')
+    parser.add_argument('-u', '--alias', default=None)
+    parser.add_argument('--async_deploy', default=False, action='store_true')
+    parser.add_argument('--detach', default=False, action='store_true')
+    parser.add_argument('--resume', default=False, action='store_true')
+    parser.add_argument('--state', default='deploy_state.json')
+    parser.add_argument('--max_inflight', type=int, default=0)
+    parser.add_argument('--auto_tests', default=False, action='store_true')
+    parser.add_argument('--json', default='./sfdx-project.json')
+    parser.add_argument('--commit_message', default=None)
+    parser.add_argument('--shards', type=int, default=0)
+    parser.add_argument('-q', '--quick_deploy', default=False, action='store_true')
+    parser.add_argument('--commit', default='HEAD')
+    parser.add_argument('--quick_cache', default=quick_deploy.CACHE_FILE)
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--profile', default=None)
+    args = parser.parse_args(argv)
     return args
 
 
-def create_sf_link(sf_env, log):
+DEPLOY_ID_PATTERN = re.compile(r'Deploy ID: (.*)')
+CLASSIC_SF_PATH = '/changemgmt/monitorDeploymentsDetails.apexp?retURL=' +\
+                    '/changemgmt/monitorDeployment.apexp&asyncId='
+
+
+def build_sf_link(sf_env, deploy_id):
     """
-        Function to check the deploy log for the ID
-        and build the URL.
+        Function to build the deployment status URL from the ID.
     """
-    pattern = r'Deploy ID: (.*)'
-    classic_sf_path = '/changemgmt/monitorDeploymentsDetails.apexp?retURL=' +\
-                        '/changemgmt/monitorDeployment.apexp&asyncId='
+    # the page expects the 15 character ID
+    sf_id = deploy_id.strip()[:-3]
+    return f'{sf_env}{CLASSIC_SF_PATH}{sf_id}'
 
-    # keep reading the log until the ID has been found
-    with open(log, 'r', encoding='utf-8') as deploy_file:
-        while True:
-            file_line = deploy_file.readline()
-            match = re.search(pattern, file_line)
-            # if regex is found, build the link and break the loop
-            if match:
-                deploy_id = match.group(1)
-                sf_id = deploy_id[:-3]
-                deploy_url = sf_env + classic_sf_path + sf_id
-                logging.info(deploy_url)
-                break
 
-
-def run_command(cmd):
+def stream_deploy(command, sf_env, outputs, label=None):
     """
-        Function to run the command using the native shell
+        Function to run the deploy command and read its output as it arrives.
+        Every line is written to the outputs (log files, stdout) and the
+        deployment link is logged as soon as the Deploy ID is printed.
+        Returns the exit code and the deploy ID (None if none was printed).
     """
-    try:
-        subprocess.run(cmd, check=True, shell=True)
-    except subprocess.CalledProcessError as exception:
-        # store the exception in the thread object
-        threading.current_thread().exc = exception
+    deploy_id = None
+    with metrics.stage('sfdx', command=command[1], label=label) as record:
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       universal_newlines=True, encoding='utf-8')
+        except OSError as exception:
+            # e.g. sfdx is not installed or not on the PATH
+            message = f'ERROR: Could not run {command[0]}: {exception}'
+            logging.error(message)
+            for output in outputs:
+                if output is not sys.stdout:
+                    output.write(message + '\n')
+            record['returncode'] = 1
+            return 1, None
+        with process:
+            for line in process.stdout:
+                for output in outputs:
+                    output.write(line)
+                    output.flush()
+                match = DEPLOY_ID_PATTERN.search(line)
+                if match and deploy_id is None:
+                    deploy_id = match.group(1).strip()
+                    if sf_env and label:
+                        logging.info('%s: %s', label, build_sf_link(sf_env, deploy_id))
+                    elif sf_env:
+                        logging.info(build_sf_link(sf_env, deploy_id))
+        record['returncode'] = process.returncode
+    return process.returncode, deploy_id
 
 
 def remove_spaces(string):
@@ -79,47 +154,299 @@ def remove_spaces(string):
     return re.sub(pattern, '', string)
 
 
-def main(tests, manifest, wait, environment, log, validate, debug):
+def build_deploy_command(manifest, tests, wait, validate, alias=None):
     """
-        Main function to deploy metadata to Salesforce.
+        Function to build the deploy command as an argument list.
     """
-    # Define the command
-    if tests and not tests.isspace():
-        tests = remove_spaces(tests)
-        command = (f'sfdx force:source:deploy -m {manifest} -l RunSpecifiedTests'
-                    f' -r "{tests}" -w {wait} --verbose')
-    else:
-        command = (f'sfdx force:source:deploy -m {manifest} -l RunSpecifiedTests'
-                   f' -r "not,a,test" -w {wait} --verbose')
-
+    if not tests or tests.isspace():
+        tests = 'not,a,test'
+    command = ['sfdx', 'force:source:deploy', '-m', manifest, '-l', 'RunSpecifiedTests',
+               '-r', remove_spaces(tests), '-w', str(wait), '--verbose']
+    if alias:
+        command.extend(['-u', alias])
     # Append '-c' flag to run a validation deployment
     if validate:
-        command += ' -c'
+        command.append('-c')
+    return command
+
+
+def build_quick_deploy_command(deploy_id, wait, alias=None):
+    """
+        Function to build the quick deploy command of a validated deployment.
+    """
+    command = ['sfdx', 'force:source:deploy', '-q', deploy_id, '-w', str(wait)]
+    if alias:
+        command.extend(['-u', alias])
+    return command
+
+
+def try_quick_deploy(key, wait, environment, alias, outputs, cache_file):
+    """
+        Function to quick deploy the saved validation of the key.
+        Returns the exit code, or None if there is no validation
+        to deploy or the quick deploy failed.
+    """
+    deploy_id = quick_deploy.lookup(key, cache_file)
+    if deploy_id is None:
+        logging.info('No validation to quick deploy, running a full deploy.')
+        return None
+    command = build_quick_deploy_command(deploy_id, wait, alias)
+    logging.info(' '.join(command))
+    returncode, _deploy_id = stream_deploy(command, environment, outputs)
+    # a validation can only be quick deployed once
+    quick_deploy.forget(key, cache_file)
+    if returncode != 0:
+        logging.warning('WARNING: Quick deploy of %s failed, running a full deploy.', deploy_id)
+        return None
+    return returncode
+
+
+def load_jobs(jobs_file, targets, environment):
+    """
+        Function to read the jobs file.
+        Returns a list of tasks, each task is a list of jobs run one after the other.
+        Chunks from the create_delta_package index are deployed in order
+        to every target, and the targets run in parallel.
+    """
+    with open(jobs_file, encoding='utf-8') as file:
+        parsed_json = json.load(file)
+
+    if isinstance(parsed_json, dict) and 'chunks' in parsed_json:
+        if not targets:
+            sys.exit('ERROR: --targets is required to deploy a chunk index.')
+        tasks = []
+        for alias in targets.split(','):
+            tasks.append([{'manifest': chunk['manifest'], 'alias': alias.strip(),
+                           'environment': environment}
+                          for chunk in parsed_json['chunks']])
+        return tasks
+
+    tasks = []
+    for job in parsed_json:
+        job.setdefault('environment', environment)
+        tasks.append([job])
+    return tasks
+
+
+def deploy_job(job, tests, wait, validate, log_dir):
+    """
+        Function to run one deploy job, writing its output to its own log file.
+        Returns the job with its exit code, duration, log and link.
+    """
+    alias = job.get('alias')
+    manifest_name = os.path.splitext(os.path.basename(job['manifest']))[0]
+    log_file = os.path.join(log_dir, f'{alias or "default"}_{manifest_name}.log')
+    command = build_deploy_command(job['manifest'], tests, wait, validate, alias)
+    result = dict(job, log=log_file, link=None)
+
+    start = time.monotonic()
+    with open(log_file, 'w', encoding='utf-8') as log:
+        log.write(' '.join(command) + '\n')
+        returncode, deploy_id = stream_deploy(command, job.get('environment'), [log],
+                                              f'{alias} {job["manifest"]}')
+    result['returncode'] = returncode
+    result['seconds'] = time.monotonic() - start
+    if deploy_id and job.get('environment'):
+        result['link'] = build_sf_link(job['environment'], deploy_id)
+    return result
+
+
+def run_task(task, tests, wait, validate, log_dir):
+    """
+        Function to run the jobs of a task in order,
+        stopping at the first failure.
+    """
+    results = []
+    for job in task:
+        results.append(deploy_job(job, tests, wait, validate, log_dir))
+        if results[-1]['returncode'] != 0:
+            break
+    return results
+
+
+def run_jobs(tasks, tests, wait, validate, log_dir, concurrency):
+    """
+        Function to run the tasks with a bounded worker pool
+        and log a timing table. Returns 1 if any job failed.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_task, task, tests, wait, validate, log_dir)
+                   for task in tasks]
+        results = [result for future in futures for result in future.result()]
+
+    logging.info('%-20s %-40s %-8s %10s', 'ALIAS', 'MANIFEST', 'STATUS', 'SECONDS')
+    for result in results:
+        status = 'OK' if result['returncode'] == 0 else 'FAILED'
+        logging.info('%-20s %-40s %-8s %10.1f', result.get('alias') or 'default',
+                     result['manifest'], status, result['seconds'])
+    skipped = sum(len(task) for task in tasks) - len(results)
+    if skipped:
+        logging.info('%s jobs skipped after a failed chunk', skipped)
+    if skipped or any(result['returncode'] != 0 for result in results):
+        return 1
+    return 0
+
+
+def deploy_async(tests, manifest, wait, validate, alias, state_file, max_inflight, detach):
+    """
+        Function to submit the deployment and, unless detached,
+        poll it with backoff until it is done. Returns the exit code.
+    """
+    timeout = int(wait) * 60
+    command = build_deploy_command(manifest, tests, 0, validate, alias) + ['--json']
+    logging.info(' '.join(command))
+    deploy_id = async_deploy.submit(command, state_file, max_inflight, timeout, alias, manifest)
+    if detach:
+        return 0
+    # only this deployment decides the exit code, not the others of the state file
+    return async_deploy.resume(state_file, timeout, [deploy_id])
+
+
+def run_shard(manifest, tests, wait, alias):
+    """
+        Function to run one check-only deploy with a shard of the tests.
+        Returns the parsed JSON output and the elapsed seconds.
+    """
+    command = build_deploy_command(manifest, ','.join(tests), wait, True, alias) + ['--json']
+    start = time.monotonic()
+    deploy_json = async_deploy.run_json_command(command)
+    return deploy_json, time.monotonic() - start
+
+
+def summarize_shards(outputs):
+    """
+        Function to aggregate the test results and code coverage of every shard.
+        A class covered in several shards keeps its best coverage.
+    """
+    summary = {'success': True, 'tests_run': 0, 'failures': [], 'coverage': {}}
+    for deploy_json in outputs:
+        result = deploy_json.get('result') or deploy_json.get('data') or {}
+        if deploy_json.get('status') != 0 or not result.get('success', False):
+            summary['success'] = False
+        test_result = test_history.run_test_result(deploy_json)
+        summary['tests_run'] += int(test_result.get('numTestsRun') or 0)
+        for failure in test_history.as_list(test_result.get('failures')):
+            summary['failures'].append(f"{failure.get('name')}.{failure.get('methodName')}: "
+                                       f"{failure.get('message')}")
+        for coverage in test_history.as_list(test_result.get('codeCoverage')):
+            locations = int(coverage.get('numLocations') or 0)
+            covered = locations - int(coverage.get('numLocationsNotCovered') or 0)
+            best = summary['coverage'].get(coverage.get('name'), (0, locations))
+            summary['coverage'][coverage.get('name')] = (max(best[0], covered), locations)
+    return summary
+
+
+def deploy_shards(tests, manifest, wait, alias, shard_count):
+    """
+        Function to run the tests as parallel check-only deploys, record
+        their durations and log one pass/fail and coverage summary.
+        Returns the exit code.
+    """
+    tests = [test for test in remove_spaces(tests or '').split(',') if test]
+    if not tests:
+        sys.exit('ERROR: Tests are required to run shards.')
+    history = test_history.load_history()
+    shards = test_history.shard_tests(tests, shard_count, history)
+    for number, (seconds, shard) in enumerate(shards, start=1):
+        logging.info('Shard %s (predicted %.0fs): %s', number, seconds, ','.join(shard))
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [executor.submit(run_shard, manifest, shard, wait, alias)
+                   for _seconds, shard in shards]
+        outputs = [future.result() for future in futures]
+
+    for number, (deploy_json, seconds) in enumerate(outputs, start=1):
+        logging.info('Shard %s finished in %.1fs', number, seconds)
+        test_history.record(history, deploy_json)
+    test_history.save_history(history)
+
+    summary = summarize_shards([deploy_json for deploy_json, _seconds in outputs])
+    covered = sum(covered for covered, _locations in summary['coverage'].values())
+    locations = sum(locations for _covered, locations in summary['coverage'].values())
+    logging.info('Tests run: %s, failures: %s', summary['tests_run'], len(summary['failures']))
+    for failure in summary['failures']:
+        logging.info('  %s', failure)
+    if locations:
+        logging.info('Code coverage: %.1f%% of %s lines in %s classes',
+                     100 * covered / locations, locations, len(summary['coverage']))
+    logging.info('Validation %s', 'succeeded' if summary['success'] else 'failed')
+    return 0 if summary['success'] else 1
+
+
+def main(tests, manifest, wait, environment, log, validate, debug, alias=None,
+         quick=False, commit='HEAD', quick_cache=quick_deploy.CACHE_FILE):
+    """
+        Main function to deploy metadata to Salesforce.
+    """
+    # Define the command
+    command = build_deploy_command(manifest, tests, wait, validate, alias)
 
     if not debug:
-        logging.info(command)
-        # create and start threads
-        read_thread = threading.Thread(target=create_sf_link, args=(environment, log))
-        deploy_thread = threading.Thread(target=run_command, args=(command,))
-        read_thread.start()
-        deploy_thread.start()
-
-        # wait for deploy to finish
-        deploy_thread.join()
-
-        # kill read thread if it's still running
-        # ex: if package.xml is empty, no ID is created
-        if read_thread.is_alive():
-            read_thread.terminate()
-
-        # exit with error if exception attribute is found
-        if hasattr(deploy_thread, 'exc'):
+        # validations are saved for a later quick deploy of the same changes
+        commit_sha, key = None, None
+        if quick or validate:
+            commit_sha = quick_deploy.resolve_commit(commit)
+            key = quick_deploy.cache_key(alias or environment, manifest, commit_sha, tests)
+        # forward the output to the console and the deploy log
+        # ex: if package.xml is empty, no ID is created and no link is logged
+        with open(log, 'a', encoding='utf-8') as log_file:
+            returncode = None
+            if quick and not validate and key:
+                returncode = try_quick_deploy(key, wait, environment, alias,
+                                              [sys.stdout, log_file], quick_cache)
+            if returncode is None:
+                logging.info(' '.join(command))
+                returncode, deploy_id = stream_deploy(command, environment,
+                                                      [sys.stdout, log_file])
+                if validate and returncode == 0 and deploy_id and key:
+                    quick_deploy.record(key, deploy_id,
+                                        {'org': alias or environment, 'manifest': manifest,
+                                         'commit': commit_sha, 'tests': tests}, quick_cache)
+
+        # exit with error if the deployment failed
+        if returncode != 0:
             sys.exit(1)
     else:
-        print(command)
+        print(' '.join(command))
 
 
-if __name__ == '__main__':
-    inputs = parse_args()
+def run_deploy(inputs):
+    """
+        Function to run the deploy mode picked by the arguments.
+        Returns the exit code.
+    """
+    if inputs.jobs:
+        return run_jobs(load_jobs(inputs.jobs, inputs.targets, inputs.environment),
+                        inputs.tests, inputs.wait, inputs.validate,
+                        inputs.log_dir, inputs.concurrency)
+    if inputs.commit_message and (not inputs.tests or inputs.tests.isspace()):
+        inputs.tests = extract_tests_from_mr.extract_tests(inputs.commit_message)
+    if inputs.auto_tests and (not inputs.tests or inputs.tests.isspace()):
+        inputs.tests = ','.join(apex_test_index.tests_for_manifest(inputs.manifest, inputs.json))
+    if inputs.shards:
+        return deploy_shards(inputs.tests, inputs.manifest, inputs.wait,
+                             inputs.alias, inputs.shards)
+    if inputs.resume:
+        return async_deploy.resume(inputs.state, int(inputs.wait) * 60)
+    if inputs.async_deploy:
+        return deploy_async(inputs.tests, inputs.manifest, inputs.wait, inputs.validate,
+                            inputs.alias, inputs.state, inputs.max_inflight, inputs.detach)
     main(inputs.tests, inputs.manifest, inputs.wait, inputs.environment,
-         inputs.log, inputs.validate, inputs.debug)
+         inputs.log, inputs.validate, inputs.debug, inputs.alias,
+         inputs.quick_deploy, inputs.commit, inputs.quick_cache)
+    return 0
+
+
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+        Returns the exit code.
+    """
+    metrics.configure(inputs.metrics)
+    with metrics.profiled(inputs.profile), metrics.stage('deploy_metadata_sfdx'):
+        return run_deploy(inputs)
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
@@ -0,0 +1,109 @@
+"""
+    Streaming helpers around git diff.
+    Lists the changed paths from a NUL-delimited raw diff and
+    only fetches the patch text of a file when it is requested.
+"""
+import subprocess
+from collections.abc import Mapping
+
+# size of each read from the git pipe
+CHUNK_SIZE = 64 * 1024
+
+
+def read_nul_records(stream):
+    """
+        Generator which reads a binary stream in chunks
+        and yields each NUL-terminated record as a string.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        records = pending.split(b'\0')
+        # the last item is either empty or an incomplete record
+        pending = records.pop()
+        for record in records:
+            yield record.decode('utf-8', errors='surrogateescape')
+    if pending:
+        yield pending.decode('utf-8', errors='surrogateescape')
+
+
+def iter_raw_diff(from_ref, to_ref=None):
+    """
+        Generator which yields (status, path, old_sha, new_sha)
+        for every changed file between the two refs.
+        If to_ref is not set, from_ref is compared to the working tree.
+        Renames and copies are reported with the new path.
+    """
+    command = ['git', 'diff', '--raw', '-z', '--no-abbrev', from_ref]
+    if to_ref:
+        command.append(to_ref)
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        records = read_nul_records(process.stdout)
+        for header in records:
+            # :100644 100644 <old sha> <new sha> <status>
+            fields = header.lstrip(':').split(' ')
+            old_sha, new_sha, status = fields[2], fields[3], fields[4]
+            path = next(records)
+            # renames and copies list the old path and then the new path
+            if status[0] in ('R', 'C'):
+                path = next(records)
+            yield status[0], path, old_sha, new_sha
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def file_patch(from_ref, to_ref, path):
+    """
+        Return the textual diff of a single file.
+    """
+    command = ['git', 'diff', from_ref]
+    if to_ref:
+        command.append(to_ref)
+    command.extend(['--', path])
+    output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True,
+                            encoding='utf-8', check=True)
+    return output.stdout
+
+
+class GitDiffStream(Mapping):
+    """
+        Read-only mapping of changed file path -> patch text.
+        Only the paths, status and blob SHAs are held in memory,
+        the patch of a file is fetched from git when it is looked up.
+        The entries can be given if they are already known (batch_delta.py).
+    """
+    def __init__(self, from_ref, to_ref=None, entries=None):
+        self.from_ref = from_ref
+        self.to_ref = to_ref
+        # path -> (status, old_sha, new_sha)
+        self.entries = entries
+        if entries is None:
+            self.entries = {}
+            for status, path, old_sha, new_sha in iter_raw_diff(from_ref, to_ref):
+                self.entries[path] = (status, old_sha, new_sha)
+
+    def __getitem__(self, path):
+        if path not in self.entries:
+            raise KeyError(path)
+        return file_patch(self.from_ref, self.to_ref, path)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def status(self, path):
+        """
+            Return the git status letter of the path (A, M, D, R...)
+        """
+        return self.entries[path][0]
+
+    def blob_shas(self, path):
+        """
+            Return the (old, new) blob SHAs of the path.
+        """
+        return self.entries[path][1:]
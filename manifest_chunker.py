@@ -0,0 +1,155 @@
+"""
+    Split a large delta into several package.xml files which
+    respect the Salesforce per-deployment limits.
+    Child components stay in the same chunk as their parent and
+    chunks are ordered so dependencies are deployed first.
+"""
+import json
+import logging
+import math
+import os
+
+# import local scripts
+import metadata_types
+import package_template
+import package_writer
+
+# Salesforce allows 10,000 files and a 39 MB zip per deployment
+MAX_COMPONENTS = 10000
+MAX_BYTES = 39 * 1024 * 1024
+
+# estimated source size of a single member in bytes
+DEFAULT_SIZE = 5 * 1024
+type_Sizes = {
+    'AuraDefinitionBundle': 20 * 1024,
+    'ContentAsset': 500 * 1024,
+    'CustomObject': 20 * 1024,
+    'CustomObjectTranslation': 50 * 1024,
+    'Document': 200 * 1024,
+    'ExperienceBundle': 500 * 1024,
+    'Flow': 50 * 1024,
+    'LightningComponentBundle': 20 * 1024,
+    'PermissionSet': 50 * 1024,
+    'Profile': 500 * 1024,
+    'StaticResource': 1024 * 1024,
+}
+
+# deploy order, types missing from the list go in the middle
+deploy_Order = [
+    'GlobalValueSet', 'StandardValueSet', 'CustomLabel', 'CustomLabels',
+    'CustomObject', 'CustomField', 'RecordType', 'ValidationRule', 'CompactLayout',
+    'FieldSet', 'WebLink', 'ListView', 'CustomMetadata', 'StaticResource',
+    'ApexClass', 'ApexTrigger', 'ApexComponent', 'ApexPage',
+    'AuraDefinitionBundle', 'LightningComponentBundle',
+    # everything else
+    None,
+    'Flow', 'FlowDefinition', 'QuickAction', 'Layout', 'FlexiPage', 'CustomTab',
+    'CustomApplication', 'PermissionSet', 'Profile',
+]
+DEFAULT_RANK = deploy_Order.index(None)
+
+
+def build_parent_types():
+    """
+        Map each child type to its parent type, e.g. CustomField -> CustomObject
+        or WorkflowRule -> Workflow
+    """
+    parent_types = {}
+    for parent_type, child_list in metadata_types.has_child_Items.items():
+        for child in child_list:
+            for child_type in child.values():
+                parent_types[child_type] = parent_type
+    for container_type, children in metadata_types.inside_File.items():
+        # labels are not named after their container
+        if container_type not in metadata_types.global_Children:
+            for child_type in children.values():
+                parent_types[child_type] = container_type
+    return parent_types
+
+
+PARENT_TYPES = build_parent_types()
+RANKS = {name: rank for rank, name in enumerate(deploy_Order) if name}
+
+
+def build_units(items):
+    """
+        Group the members into units which can't be split.
+        A parent and all of its children (Account, Account.Name__c...)
+        form one unit. Returns a list of (rank, key, unit items).
+    """
+    units = {}
+    for component_type, members in items.items():
+        parent_type = PARENT_TYPES.get(component_type)
+        for member in members:
+            if parent_type:
+                key = (parent_type, member.split('.')[0])
+            else:
+                key = (component_type, member)
+            unit = units.setdefault(key, {})
+            unit.setdefault(component_type, set()).add(member)
+    return [(RANKS.get(key[0], DEFAULT_RANK), key, unit) for key, unit in units.items()]
+
+
+def unit_size(unit):
+    """
+        Return the component count and estimated bytes of a unit.
+    """
+    count = sum(len(members) for members in unit.values())
+    size = sum(type_Sizes.get(component_type, DEFAULT_SIZE) * len(members)
+               for component_type, members in unit.items())
+    return count, size
+
+
+def chunk_items(items, max_components=MAX_COMPONENTS, max_bytes=MAX_BYTES):
+    """
+        Split the items into balanced chunks.
+        Returns a list of (items, component count, estimated bytes).
+    """
+    units = sorted(build_units(items), key=lambda unit: (unit[0], unit[1]))
+    sizes = [unit_size(unit[2]) for unit in units]
+    total_count = sum(size[0] for size in sizes)
+    total_bytes = sum(size[1] for size in sizes)
+    # spread the units evenly over the fewest chunks within the limits
+    chunk_total = max(1, math.ceil(total_count / max_components),
+                      math.ceil(total_bytes / max_bytes))
+    count_target = math.ceil(total_count / chunk_total)
+    bytes_target = math.ceil(total_bytes / chunk_total)
+
+    chunks = []
+    current, count, size = {}, 0, 0
+    for (_rank, key, unit), (unit_count, unit_bytes) in zip(units, sizes):
+        if current and (count + unit_count > count_target or size + unit_bytes > bytes_target):
+            chunks.append((current, count, size))
+            current, count, size = {}, 0, 0
+        if unit_count > max_components or unit_bytes > max_bytes:
+            logging.warning('WARNING: %s %s exceeds the deployment limits on its own', *key)
+        for component_type, members in unit.items():
+            current.setdefault(component_type, set()).update(members)
+        count += unit_count
+        size += unit_bytes
+    if current:
+        chunks.append((current, count, size))
+    return chunks
+
+
+def write_chunks(items, delta_file, max_components=MAX_COMPONENTS, max_bytes=MAX_BYTES,
+                 json_file=package_template.PROJECT_FILE):
+    """
+        Write each chunk next to the delta file (delta_1.xml, delta_2.xml...)
+        and an index file (delta_chunks.json) listing them in deploy order.
+    """
+    base, ext = os.path.splitext(delta_file)
+    index = {'chunks': []}
+    for number, (chunk, count, size) in enumerate(
+            chunk_items(items, max_components, max_bytes), start=1):
+        chunk_file = f'{base}_{number}{ext}'
+        package_writer.create_package_xml(chunk, chunk_file, json_file)
+        index['chunks'].append({'manifest': chunk_file,
+                                'components': count,
+                                'estimated_bytes': size,
+                                'types': sorted(chunk)})
+    index_file = f'{base}_chunks.json'
+    with open(index_file, 'w', encoding='utf-8') as file:
+        json.dump(index, file, indent=4)
+    logging.info('Split the delta into %s chunks, see %s', len(index['chunks']), index_file)
+    return index_file
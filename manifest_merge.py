@@ -0,0 +1,126 @@
+"""
+    Merge any number of package.xml files into one dictionary of
+    metadata type -> set of members.
+    Each file is parsed incrementally and elements are released as soon
+    as their <types> block has been read.
+"""
+import argparse
+import logging
+import xml.etree.ElementTree as ET
+
+# import local script
+import package_writer
+
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+
+def parse_args(argv=None):
+    """
+        Function to parse required arguments.
+        output - merged package.xml
+        manifests - package.xml files to merge
+    """
+    parser = argparse.ArgumentParser(description='A script to merge package.xml files.')
+    parser.add_argument('-o', '--output', default='package.xml')
+    parser.add_argument('manifests', nargs='+')
+    args = parser.parse_args(argv)
+    return args
+
+
+def local_name(tag):
+    """
+        Remove the namespace from the tag, {namespace}members -> members
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def new_stats():
+    """
+        Function to initialize the merge statistics.
+    """
+    return {'manifests': 0, 'members': 0, 'duplicates': 0, 'wildcards': [], 'empty': []}
+
+
+def merge_manifest(package_path, changes, stats):
+    """
+        Parse one package.xml and add its members to the changes dictionary.
+        Wildcard and empty members are not added, they are reported in the statistics.
+    """
+    members = []
+    metadata_name = None
+    root = None
+    for event, element in ET.iterparse(package_path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
+        tag = local_name(element.tag)
+        if tag == 'members':
+            members.append(element.text)
+        elif tag == 'name':
+            metadata_name = element.text
+        elif tag == 'types':
+            if metadata_name is not None and len(metadata_name.strip()) > 0:
+                type_members = changes.setdefault(metadata_name, set())
+                for member in members:
+                    stats['members'] += 1
+                    if member is None or not member.strip():
+                        stats['empty'].append((package_path, metadata_name))
+                    # if a wilcard is present in the member, don't process it
+                    elif '*' in member:
+                        stats['wildcards'].append((package_path, metadata_name, member))
+                    elif member in type_members:
+                        stats['duplicates'] += 1
+                    else:
+                        type_members.add(member)
+                if not type_members:
+                    del changes[metadata_name]
+            members = []
+            metadata_name = None
+            # release the parsed <types> block, the root still references it
+            root.clear()
+    stats['manifests'] += 1
+    return changes
+
+
+def merge_manifests(package_paths, changes=None):
+    """
+        Merge the package.xml files into the changes dictionary.
+        Returns the changes and the merge statistics.
+    """
+    if changes is None:
+        changes = {}
+    stats = new_stats()
+    for package_path in package_paths:
+        merge_manifest(package_path, changes, stats)
+    if stats['wildcards']:
+        logging.warning('WARNING: Wildcards are not allowed in the package.xml')
+        for package_path, metadata_name, member in stats['wildcards']:
+            logging.warning('  %s: %s %s', package_path, metadata_name, member)
+    if stats['empty']:
+        logging.warning('WARNING: Empty members are not allowed in the package.xml')
+        for package_path, metadata_name in stats['empty']:
+            logging.warning('  %s: %s', package_path, metadata_name)
+    logging.info('Merged %s manifests: %s members, %s duplicates, %s wildcards '
+                 'and %s empty members skipped', stats['manifests'], stats['members'],
+                 stats['duplicates'], len(stats['wildcards']), len(stats['empty']))
+    return changes, stats
+
+
+def main(output, manifests):
+    """
+        Main function to merge the package.xml files.
+    """
+    changes, _stats = merge_manifests(manifests)
+    package_writer.create_package_xml(changes, output)
+
+
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+    """
+    main(inputs.output, inputs.manifests)
+
+
+if __name__ == '__main__':
+    run(parse_args())
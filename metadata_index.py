@@ -0,0 +1,87 @@
+"""
+    Precompiled index of the metadata types in metadata_types.py
+    Resolves the (component type, member) of a file path by looking up
+    each directory in the path instead of scanning every metadata type.
+"""
+import os
+import re
+
+# import local script
+import metadata_types
+
+# a parent object folder must be a single word, e.g. objects/Account/fields
+word_pattern = re.compile(r'\w+')
+
+
+def build_index():
+    """
+        Build the lookup tables once from metadata_types.
+        dir_types - directory name -> (priority, XML name)
+            when several directories of a path are metadata folders,
+            the one defined last in metadata_Types wins
+        child_types - parent XML name -> {child directory name: child XML name}
+    """
+    dir_types = {}
+    for priority, (directory, xml_name) in enumerate(metadata_types.metadata_Types.items()):
+        dir_types[directory] = (priority, xml_name)
+
+    child_types = {}
+    for parent_type, child_list in metadata_types.has_child_Items.items():
+        children = {}
+        for child in child_list:
+            for directory, xml_name in child.items():
+                # keep the first definition if a directory is listed twice
+                children.setdefault(directory, xml_name)
+        child_types[parent_type] = children
+    return dir_types, child_types
+
+
+DIR_TYPES, CHILD_TYPES = build_index()
+FOLDER_TYPES = frozenset(metadata_types.inside_Folder)
+
+
+def resolve(file_path):
+    """
+        Resolve the component type and member of a file path.
+        Returns ('', '') if the path is not in a metadata folder.
+        Files which need to be parsed (metadata_types.inside_File)
+        are returned with their container type.
+    """
+    segments = file_path.split('/')
+    # only directories count, so skip the first segment (no leading /)
+    # and the last one (file name)
+    best = None
+    for position in range(1, len(segments) - 1):
+        found = DIR_TYPES.get(segments[position])
+        if found is not None and (best is None or found[0] > best[0]):
+            best = (found[0], found[1], segments[position])
+    if best is None:
+        return ('', '')
+
+    component_type, directory = best[1], best[2]
+    name = segments[-1].split('.')[0]
+    subdirname = segments[-2]
+    member = (name,)
+
+    # Include the parent folder for specific items
+    if component_type in FOLDER_TYPES:
+        member = (subdirname + os.sep + name,)
+
+    # Child items are named after their parent, e.g. Account.Name__c
+    child_type = CHILD_TYPES.get(component_type, {}).get(subdirname)
+    if child_type:
+        parent_object = find_parent_object(segments, directory)
+        component_type = child_type
+        member = (f'{parent_object}.{member[0]}',)
+    return (component_type, member)
+
+
+def find_parent_object(segments, directory):
+    """
+        Return the folder right after the first occurrence of
+        the parent type directory, e.g. Account in objects/Account/fields
+    """
+    for position in range(1, len(segments) - 2):
+        if segments[position] == directory and word_pattern.fullmatch(segments[position + 1]):
+            return segments[position + 1]
+    raise ValueError(f'Parent folder not found for {"/".join(segments)}')
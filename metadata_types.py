@@ -6,7 +6,32 @@
 # use XML name for types which need the folder
 inside_Folder = ['Dashboard', 'Document', 'EmailTemplate', 'Report']
 # requires names inside the file
-inside_File = ['CustomLabels']
+# container XML name -> {child element: child XML name}
+# only the changed children are added to the delta (container_children.py)
+inside_File = {
+                'CustomLabels': {'labels': 'CustomLabel'},
+                'Workflow': {'alerts': 'WorkflowAlert',
+                             'fieldUpdates': 'WorkflowFieldUpdate',
+                             'flowActions': 'WorkflowFlowAction',
+                             'knowledgePublishes': 'WorkflowKnowledgePublish',
+                             'outboundMessages': 'WorkflowOutboundMessage',
+                             'rules': 'WorkflowRule',
+                             'send': 'WorkflowSend',
+                             'tasks': 'WorkflowTask'},
+                'SharingRules': {'sharingCriteriaRules': 'SharingCriteriaRule',
+                                 'sharingGuestRules': 'SharingGuestRule',
+                                 'sharingOwnerRules': 'SharingOwnerRule',
+                                 'sharingTerritoryRules': 'SharingTerritoryRule'},
+                'AssignmentRules': {'assignmentRule': 'AssignmentRule'},
+                'AutoResponseRules': {'autoResponseRule': 'AutoResponseRule'},
+                'EscalationRules': {'escalationRule': 'EscalationRule'},
+                'MatchingRules': {'matchingRules': 'MatchingRule'}
+              }
+# Translations is not listed: it has no child types which can be
+# deployed on their own, so a changed translation deploys the whole file
+# child members which are not named after their container, e.g. a label
+# is Label_1 while a workflow rule is Account.Rule_1
+global_Children = ['CustomLabels']
 # if the type has child items, define child directory name and XML name
 has_child_Items = {
                     'CustomObject': [{'fields': 'CustomField'},
@@ -49,6 +74,7 @@ metadata_Types = {
     "email": "EmailTemplate",
     "emailservices": "EmailServicesFunction",
     "escalationrules": "EscalationRules",
+    "escalationRules": "EscalationRules",
     "experiences": "ExperienceBundle",
     "feedFilters": "CustomFeedFilter",
     "flexipages": "FlexiPage",
@@ -68,7 +94,7 @@ metadata_Types = {
     "liveChatAgentConfigs": "LiveChatAgentConfig",
     "liveChatDeployments": "LiveChatDeployment",
     "lwc": "LightningComponentBundle",
-    "matchingRules": "MatchingRule",
+    "matchingRules": "MatchingRules",
     "messageChannels": "LightningMessageChannel",
     "namedCredentials": "NamedCredential",
     "navigationMenus": "NavigationMenu",
@@ -95,7 +121,7 @@ metadata_Types = {
     "samlssoconfigs": "SamlSsoConfig",
     "scontrols": "Scontrol",
     "settings": "Settings",
-    "sharingRules": "sharingRules",
+    "sharingRules": "SharingRules",
     "sharingSets": "SharingRules",
     "siteDotComSites": "SiteDotCom",
     "sites": "CustomSite",
@@ -106,6 +132,7 @@ metadata_Types = {
     "territory2Models": "Territory2Model",
     "territory2Types": "Territory2Type",
     "topicsForObjects": "TopicsForObjects",
+    "translations": "Translations",
     "triggers": "ApexTrigger",
     "wave": "wave",
     "webLinks": "WebLink",
@@ -0,0 +1,154 @@
+"""
+    Stage timing for the pipeline scripts.
+    Each stage appends one JSON line to the metrics file with its wall time,
+    the number of items it handled and the peak RSS. getrusage only gives
+    the high-water mark since the process started, so the record has
+    process_peak_rss_kb (that mark, the same for every stage after the
+    largest one), peak_rss_growth_kb (how much this stage raised it) and
+    children_peak_rss_kb (the largest finished subprocess, e.g. sfdx or git).
+    The metrics file is set with --metrics or the SFCI_METRICS variable,
+    nothing is written if neither is set.
+    python ./create_delta_package.py -f HEAD~1 -t HEAD --metrics metrics.jsonl --profile delta.prof
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# resource is not available on Windows, peak RSS is left empty there
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_settings = {'metrics_file': os.environ.get('SFCI_METRICS')}
+_lock = threading.Lock()
+
+
+def configure(metrics_file=None):
+    """
+        Function to set the metrics file, keeps SFCI_METRICS if not set.
+    """
+    if metrics_file:
+        _settings['metrics_file'] = metrics_file
+
+
+def peak_rss_kb(who=None):
+    """
+        Function to return the peak RSS in KB of this process,
+        or of its finished subprocesses if who is RUSAGE_CHILDREN.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    if sys.platform == 'darwin':
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+
+def write_record(record):
+    """
+        Function to append the record to the metrics file.
+    """
+    metrics_file = _settings['metrics_file']
+    if not metrics_file:
+        return
+    line = json.dumps(record, sort_keys=True)
+    # stages of parallel deploys finish in different threads
+    with _lock:
+        with open(metrics_file, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+        Context manager to time a stage.
+        Yields the record, so the stage can set record['items']
+        or any other field before it is written.
+    """
+    record = {'stage': name, 'pid': os.getpid(), 'started': round(time.time(), 3)}
+    record.update(fields)
+    start = time.perf_counter()
+    start_peak = peak_rss_kb()
+    try:
+        yield record
+    except BaseException:
+        record['failed'] = True
+        raise
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 6)
+        record['process_peak_rss_kb'] = peak_rss_kb()
+        if start_peak is not None:
+            record['peak_rss_growth_kb'] = record['process_peak_rss_kb'] - start_peak
+        if resource is not None:
+            record['children_peak_rss_kb'] = peak_rss_kb(resource.RUSAGE_CHILDREN)
+        write_record(record)
+
+
+def count_items(result):
+    """
+        Default item count of a stage result: the number of
+        members of a type -> members dictionary, else its length.
+    """
+    if isinstance(result, dict) and all(isinstance(members, set)
+                                        for members in result.values()):
+        return sum(len(members) for members in result.values())
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def timed(name=None, count=count_items):
+    """
+        Decorator to time every call of the function as a stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name or function.__name__) as record:
+                result = function(*args, **kwargs)
+                record['items'] = count(result)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiled(profile_file=None):
+    """
+        Context manager to run the block under cProfile and
+        dump the stats to the profile file (python -m pstats <file>).
+        Does nothing if the profile file is not set, or if a profiler is
+        already running (e.g. sfci --profile X <command> --profile Y),
+        Python 3.12+ doesn't allow two at the same time.
+    """
+    if not profile_file:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        if _settings.get('profiling'):
+            raise ValueError('Another profiler is already active')
+        profiler.enable()
+    except ValueError as exception:
+        logging.warning('WARNING: %s is not written: %s', profile_file, exception)
+        profiler = None
+    if profiler is None:
+        yield
+        return
+    _settings['profiling'] = True
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _settings['profiling'] = False
+        profiler.dump_stats(profile_file)
+        logging.info('Profile written to %s', profile_file)
@@ -1,15 +1,112 @@
 """
     Package.xml template
-    Pull latest API version from api_version.py
+    The API version is only resolved when the footer is rendered, from:
+    1. the SF_API_VERSION environment variable
+    2. the local cache (.sfci-cache/api_version.json) if it is not expired
+    3. the latest version from api_version.py
+    4. sourceApiVersion in sfdx-project.json if Salesforce can't be reached
+    Callers pass their -j/--json project file, ./sfdx-project.json by default.
 """
-from api_version import find_latest_version
+import functools
+import json
+import logging
+import os
+import time
 
-API_VERSION = find_latest_version('https://my.salesforce.com/services/data/')
+# import local script
+import check_package_dir
+
+API_URL = 'https://my.salesforce.com/services/data/'
+API_TIMEOUT = 10
+ENV_VARIABLE = 'SF_API_VERSION'
+CACHE_FILE = os.path.join('.sfci-cache', 'api_version.json')
+# keep the cached version for a day
+CACHE_TTL = 24 * 60 * 60
+# default project file for the sourceApiVersion fallback
+PROJECT_FILE = './sfdx-project.json'
 
 PKG_HEADER = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
 <Package xmlns="http://soap.sforce.com/2006/04/metadata">
 '''
 
-PKG_FOOTER = f'''\t<version>{API_VERSION}</version>
+
+def read_cached_version():
+    """
+        Return the cached API version, or None if missing or expired.
+    """
+    try:
+        with open(CACHE_FILE, encoding='utf-8') as cache_file:
+            cached = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cached.get('time', 0) > CACHE_TTL:
+        return None
+    return cached.get('version')
+
+
+def write_cached_version(version):
+    """
+        Save the API version to the cache file.
+    """
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(CACHE_FILE, 'w', encoding='utf-8') as cache_file:
+            json.dump({'version': version, 'time': time.time()}, cache_file)
+    except OSError as exception:
+        logging.warning('WARNING: Could not cache the API version: %s', exception)
+
+
+def read_project_version(json_file=PROJECT_FILE):
+    """
+        Return sourceApiVersion from the sfdx-project.json file, if set.
+    """
+    try:
+        return check_package_dir.load_project(os.path.abspath(json_file)).get('sourceApiVersion')
+    except (OSError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_api_version(json_file=PROJECT_FILE):
+    """
+        Resolve the API version once per process and project file.
+    """
+    version = os.environ.get(ENV_VARIABLE) or read_cached_version()
+    if version:
+        return version
+
+    # deferred so importing this module doesn't import urllib
+    import http.client
+    from api_version import find_latest_version
+    try:
+        version = str(find_latest_version(API_URL, API_TIMEOUT))
+        write_cached_version(version)
+        return version
+    except (OSError, ValueError, KeyError, http.client.HTTPException) as exception:
+        logging.warning('WARNING: Could not get the latest API version: %s', exception)
+
+    version = read_project_version(json_file)
+    if not version:
+        raise RuntimeError(f'API version not found, set the {ENV_VARIABLE} environment variable.')
+    return version
+
+
+def package_footer(json_file=PROJECT_FILE):
+    """
+        Render the package.xml footer with the API version.
+    """
+    return f'''\t<version>{get_api_version(json_file)}</version>
 </Package>
 '''
+
+
+def __getattr__(name):
+    """
+        Lazy module attributes, so API_VERSION and PKG_FOOTER
+        are only resolved when they are used.
+    """
+    if name == 'API_VERSION':
+        return get_api_version()
+    if name == 'PKG_FOOTER':
+        return package_footer()
+    raise AttributeError(f'module {__name__} has no attribute {name}')
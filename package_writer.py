@@ -0,0 +1,43 @@
+"""
+    Write the package.xml file from a dictionary of
+    metadata type -> set of members.
+    Types and members are sorted so the output is the same on every run.
+"""
+import logging
+from html import escape
+
+# import local scripts
+import metrics
+import package_template
+
+
+def create_package_xml(items, output_file, json_file=package_template.PROJECT_FILE):
+    """
+        Create the package.xml file, streaming
+        each <types> block straight to the file.
+        The API version is resolved (from json_file if Salesforce
+        can't be reached) before the file is opened, so a failure
+        doesn't leave a truncated package.xml behind.
+    """
+    footer = package_template.package_footer(json_file)
+    member_count = 0
+    with metrics.stage('create_package_xml') as record, \
+            open(output_file, 'w', encoding='utf-8') as package_file:
+        package_file.write(package_template.PKG_HEADER)
+        # Append each item to the package
+        #    <types>
+        #       <members>ProjectTaskTriggerHandler</members>
+        #       <name>ApexClass</name>
+        #    </types>
+        for key in sorted(items):
+            package_file.write('\t<types>\n')
+            for member in sorted(items[key]):
+                package_file.write(f'\t\t<members>{escape(member, quote=False)}</members>\n')
+                member_count += 1
+            package_file.write(f'\t\t<name>{escape(key, quote=False)}</name>\n')
+            package_file.write('\t</types>\n')
+        package_file.write(footer)
+        size = package_file.tell()
+        record.update({'items': member_count, 'bytes': size})
+    logging.info('Auto-generated package %s: %s types, %s members, %s bytes',
+                 output_file, len(items), member_count, size)
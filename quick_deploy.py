@@ -0,0 +1,114 @@
+"""
+    Local cache of validated deployments for quick deploys.
+    A successful validation (check-only deploy with tests) is saved with a key
+    built from the target org, the manifest content, the commit and the tests.
+    A later deploy with the same key, inside the quick deploy window,
+    can deploy the validated ID without running the tests again.
+"""
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+
+CACHE_FILE = os.path.join('.sfci-cache', 'quick_deploy.json')
+# Salesforce keeps a validation available for quick deploy for 10 days
+QUICK_DEPLOY_WINDOW = 10 * 24 * 60 * 60
+
+
+def file_hash(path):
+    """
+        Function to hash the content of the manifest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def resolve_commit(ref='HEAD'):
+    """
+        Function to return the commit SHA of the ref, or None outside a git repo.
+    """
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--verify', f'{ref}^{{commit}}'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def normalize_tests(tests):
+    """
+        Function to sort the test classes so their order doesn't change the key.
+    """
+    return sorted({test.strip() for test in (tests or '').split(',') if test.strip()})
+
+
+def cache_key(org, manifest, commit, tests):
+    """
+        Function to build the key of a deployment:
+        sha256 of the org, manifest content hash, commit SHA and sorted tests.
+        Returns None if the manifest or the commit can't be read.
+    """
+    if commit is None or not os.path.isfile(manifest):
+        return None
+    key = json.dumps([org or 'default', file_hash(manifest), commit, normalize_tests(tests)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def load_cache(cache_file=CACHE_FILE):
+    """
+        Function to read the validated deployments still inside the window.
+    """
+    try:
+        with open(cache_file, encoding='utf-8') as file:
+            entries = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {key: entry for key, entry in entries.items()
+            if now - entry.get('validated', 0) < QUICK_DEPLOY_WINDOW}
+
+
+def save_cache(entries, cache_file=CACHE_FILE):
+    """
+        Function to write the cache file, replacing it atomically.
+    """
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    temp_file = f'{cache_file}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(entries, file, indent=4, sort_keys=True)
+    os.replace(temp_file, cache_file)
+
+
+def record(key, deploy_id, details, cache_file=CACHE_FILE):
+    """
+        Function to save a successful validation.
+    """
+    entries = load_cache(cache_file)
+    entries[key] = dict(details, deploy_id=deploy_id, validated=time.time())
+    save_cache(entries, cache_file)
+    logging.info('Validation %s saved for quick deploy', deploy_id)
+
+
+def lookup(key, cache_file=CACHE_FILE):
+    """
+        Function to return the validated deploy ID of the key, or None
+        if it was never validated or the quick deploy window has passed.
+    """
+    entry = load_cache(cache_file).get(key)
+    return entry['deploy_id'] if entry else None
+
+
+def forget(key, cache_file=CACHE_FILE):
+    """
+        Function to remove a validation once it was deployed or rejected,
+        an ID can only be quick deployed once.
+    """
+    entries = load_cache(cache_file)
+    if entries.pop(key, None) is not None:
+        save_cache(entries, cache_file)
@@ -0,0 +1,124 @@
+"""
+    Single entry point for the pipeline scripts.
+    python ./sfci.py delta -f $CI_COMMIT_BEFORE_SHA -t $CI_COMMIT_SHA
+    python ./sfci.py batch steps.txt
+    Only the module of the subcommand is imported. Steps of a batch file run
+    in the same process, so the parsed sfdx-project.json, the metadata index
+    and the API version are shared between them.
+"""
+import argparse
+import importlib
+import logging
+import shlex
+import sys
+import time
+
+# import local script
+import metrics
+
+# subcommand -> module with parse_args(argv) and run(inputs)
+COMMANDS = {
+    'delta': 'create_delta_package',
+    'batch-delta': 'batch_delta',
+    'merge': 'manifest_merge',
+    'deploy': 'deploy_metadata_sfdx',
+    'auth': 'authenticate_sfdx',
+    'api-version': 'api_version',
+    'labels': 'custom_labels',
+    'watch': 'watch_delta',
+}
+
+
+def parse_args(argv=None):
+    """
+        Function to parse required arguments.
+        command - subcommand to run, or batch
+        args - arguments of the subcommand, or the batch file
+            (one subcommand and its arguments per line, # for comments)
+        keep_going - continue the batch after a failed step
+        metrics - append the timing of each stage to this JSON-lines file
+        profile - dump the cProfile stats of the whole run to this file
+    """
+    parser = argparse.ArgumentParser(description='A script to run the pipeline steps.')
+    parser.add_argument('command', choices=sorted(COMMANDS) + ['batch'])
+    parser.add_argument('--keep_going', default=False, action='store_true')
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--profile', default=None)
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    return args
+
+
+def run_command(command, argv):
+    """
+        Import the module of the subcommand and run it.
+        Returns the exit code, scripts which call sys.exit() are caught.
+    """
+    module = importlib.import_module(COMMANDS[command])
+    try:
+        exit_code = module.run(module.parse_args(argv))
+    except SystemExit as exception:
+        exit_code = exception.code
+    if exit_code is None:
+        return 0
+    if isinstance(exit_code, int):
+        return exit_code
+    # sys.exit('ERROR: ...') prints the message and exits with 1
+    logging.error(exit_code)
+    return 1
+
+
+def read_batch(batch_file):
+    """
+        Generator which yields the (command, argv) of each batch line.
+    """
+    with open(batch_file, encoding='utf-8') as file:
+        for line in file:
+            words = shlex.split(line, comments=True)
+            if words:
+                yield words[0], words[1:]
+
+
+def run_batch(batch_file, keep_going):
+    """
+        Run every step of the batch file in this process.
+        Returns 1 if a step failed.
+    """
+    failed = False
+    for command, argv in read_batch(batch_file):
+        if command not in COMMANDS:
+            logging.error('ERROR: Unknown command %s in %s', command, batch_file)
+            return 1
+        start = time.perf_counter()
+        try:
+            exit_code = run_command(command, argv)
+        # a failing step shouldn't lose the results of the others
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('ERROR: %s failed', command)
+            exit_code = 1
+        logging.info('[sfci] %s finished with exit code %s in %.2fs',
+                     command, exit_code, time.perf_counter() - start)
+        if exit_code != 0:
+            failed = True
+            if not keep_going:
+                break
+    return 1 if failed else 0
+
+
+def main(command, args, keep_going):
+    """
+        Main function to run a subcommand or a batch file.
+    """
+    if command == 'batch':
+        if len(args) != 1:
+            sys.exit('ERROR: batch takes the path of the batch file.')
+        return run_batch(args[0], keep_going)
+    return run_command(command, args)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+    metrics.configure(inputs.metrics)
+    with metrics.profiled(inputs.profile):
+        sys.exit(main(inputs.command, inputs.args, inputs.keep_going))
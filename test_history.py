@@ -0,0 +1,142 @@
+"""
+    Local history of Apex test class durations, read from the
+    JSON results of deployments (sfdx force:source:deploy --json).
+    Used to split tests into shards with balanced predicted runtimes.
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import statistics
+
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+HISTORY_FILE = os.path.join('.sfci-cache', 'test_durations.json')
+# seconds predicted for a test class with no history
+DEFAULT_SECONDS = 60
+# weight of the latest run in the moving average
+RECENT_WEIGHT = 0.3
+
+
+def parse_args():
+    """
+        Function to parse required arguments.
+        results - JSON output files of deployments to record
+        history - test duration history file
+    """
+    parser = argparse.ArgumentParser(description='A script to record Apex test durations.')
+    parser.add_argument('results', nargs='+')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    args = parser.parse_args()
+    return args
+
+
+def load_history(history_file=HISTORY_FILE):
+    """
+        Function to read the history: class name -> {seconds, runs}
+    """
+    try:
+        with open(history_file, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(history, history_file=HISTORY_FILE):
+    """
+        Function to write the history file.
+    """
+    os.makedirs(os.path.dirname(history_file) or '.', exist_ok=True)
+    with open(history_file, 'w', encoding='utf-8') as file:
+        json.dump(history, file, indent=4, sort_keys=True)
+
+
+def run_test_result(deploy_json):
+    """
+        Return the runTestResult of a deployment JSON output.
+        Failed deployments keep it under data instead of result.
+    """
+    result = deploy_json.get('result') or deploy_json.get('data') or {}
+    return (result.get('details') or {}).get('runTestResult') or {}
+
+
+def as_list(value):
+    """
+        The API returns a dictionary instead of a list for a single item.
+    """
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def class_durations(deploy_json):
+    """
+        Function to sum the method times (ms) of each test class, in seconds.
+    """
+    test_result = run_test_result(deploy_json)
+    durations = {}
+    for method in as_list(test_result.get('successes')) + as_list(test_result.get('failures')):
+        name = method.get('name')
+        if name:
+            durations[name] = durations.get(name, 0) + float(method.get('time') or 0) / 1000
+    return durations
+
+
+def record(history, deploy_json):
+    """
+        Function to add the durations of a deployment to the history.
+    """
+    for name, seconds in class_durations(deploy_json).items():
+        entry = history.get(name)
+        if entry is None:
+            history[name] = {'seconds': seconds, 'runs': 1}
+        else:
+            entry['seconds'] = RECENT_WEIGHT * seconds + (1 - RECENT_WEIGHT) * entry['seconds']
+            entry['runs'] += 1
+    return history
+
+
+def predict(history, tests):
+    """
+        Function to predict the seconds of each test class.
+        Unknown classes get the median of the known ones.
+    """
+    known = [history[test]['seconds'] for test in tests if test in history]
+    default = statistics.median(known) if known else DEFAULT_SECONDS
+    return {test: history[test]['seconds'] if test in history else default for test in tests}
+
+
+def shard_tests(tests, shard_count, history):
+    """
+        Function to split the tests into shards with balanced runtimes.
+        Longest tests first, each one going to the shard with the
+        lowest predicted total. Returns a list of (seconds, tests).
+    """
+    predictions = predict(history, tests)
+    shards = [(0, number, []) for number in range(min(shard_count, len(tests)))]
+    heapq.heapify(shards)
+    for test in sorted(tests, key=lambda test: (-predictions[test], test)):
+        seconds, number, shard = heapq.heappop(shards)
+        shard.append(test)
+        heapq.heappush(shards, (seconds + predictions[test], number, shard))
+    # keep the shards in their creation order
+    return [(seconds, sorted(shard))
+            for seconds, _number, shard in sorted(shards, key=lambda s: s[1])]
+
+
+def main(results, history_file):
+    """
+        Main function to record the durations of saved deployment results.
+    """
+    history = load_history(history_file)
+    for result_file in results:
+        with open(result_file, encoding='utf-8') as file:
+            record(history, json.load(file))
+    save_history(history, history_file)
+    logging.info('Test duration history: %s classes', len(history))
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    main(inputs.results, inputs.history)
@@ -0,0 +1,108 @@
+"""
+    Shared fixtures: the scripts are imported from the repo root,
+    sfdx is replaced by tests/stub/sfdx and HTTP requests go to a local server.
+"""
+import http.server
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_DIR = os.path.join(ROOT, 'tests', 'stub')
+sys.path.insert(0, ROOT)
+
+
+class SfdxStub(object):
+    """
+        Class to script the responses of the stub sfdx and read its calls.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+
+    def respond(self, command, *responses):
+        """
+            Queue the responses (stdout, returncode) of a command.
+        """
+        responses_file = os.path.join(self.folder, 'responses.json')
+        try:
+            with open(responses_file, encoding='utf-8') as file:
+                queued = json.load(file)
+        except OSError:
+            queued = {}
+        queued.setdefault(command, []).extend(
+            {'stdout': stdout, 'returncode': returncode} for stdout, returncode in responses)
+        with open(responses_file, 'w', encoding='utf-8') as file:
+            json.dump(queued, file)
+
+    def calls(self):
+        """
+            Return the argument lists of every call, in order.
+        """
+        try:
+            with open(os.path.join(self.folder, 'calls.jsonl'), encoding='utf-8') as file:
+                return [json.loads(line) for line in file]
+        except OSError:
+            return []
+
+
+@pytest.fixture
+def sfdx(tmp_path, monkeypatch):
+    """
+        Run the test in an empty folder with the stub sfdx first on the PATH.
+    """
+    stub_folder = tmp_path / 'sfdx_stub'
+    stub_folder.mkdir()
+    monkeypatch.setenv('SFDX_STUB_DIR', str(stub_folder))
+    monkeypatch.setenv('PATH', STUB_DIR + os.pathsep + os.environ['PATH'])
+    monkeypatch.chdir(tmp_path)
+    return SfdxStub(str(stub_folder))
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+        Class to answer GET requests with the server's body and ETag,
+        or 304 Not Modified when If-None-Match matches the ETag.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.status == 200 and self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(server.body).encode('utf-8')
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+        Serve a JSON body on a local port, set its status, body and etag
+        attributes to change the responses. Received headers are in requests.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.status = 200
+    server.body = []
+    server.etag = '"1"'
+    server.requests = []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/services/data/'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
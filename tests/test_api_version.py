@@ -0,0 +1,64 @@
+"""
+    Tests of the batch API version check against a local HTTP server.
+"""
+import json
+
+import pytest
+
+import api_version
+
+VERSIONS = [{'label': "Summer '23", 'url': '/services/data/v58.0', 'version': '58.0'},
+            {'label': "Winter '24", 'url': '/services/data/v59.0', 'version': '59.0'}]
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_version, 'HTTP_CACHE_FILE', str(tmp_path / 'http_cache.json'))
+    project_file = tmp_path / 'sfdx-project.json'
+    project_file.write_text(json.dumps({'sourceApiVersion': '58.0'}), encoding='utf-8')
+    return str(project_file)
+
+
+def test_not_modified_reuses_the_cached_version(http_server, project):
+    http_server.body = VERSIONS
+    pairs = [{'url': http_server.url, 'file': project}]
+
+    rows = api_version.check_projects(pairs, 2, 5, 0)
+    assert rows[0]['latest_version'] == 59.0
+    assert rows[0]['behind'] is True
+    assert 'If-None-Match' not in http_server.requests[0]
+
+    # the versions list is gone from the body, only a 304 can give 59.0 again
+    http_server.body = []
+    rows = api_version.check_projects(pairs, 2, 5, 0)
+    assert rows[0]['latest_version'] == 59.0
+    assert http_server.requests[1]['If-None-Match'] == '"1"'
+
+
+def test_changed_etag_reads_the_new_versions(http_server, project):
+    http_server.body = VERSIONS[:1]
+    pairs = [{'url': http_server.url, 'file': project}]
+    assert api_version.check_projects(pairs, 2, 5, 0)[0]['behind'] is False
+
+    http_server.body = VERSIONS
+    http_server.etag = '"2"'
+    rows = api_version.check_projects(pairs, 2, 5, 0)
+    assert rows[0]['latest_version'] == 59.0
+    with open(api_version.HTTP_CACHE_FILE, encoding='utf-8') as cache_file:
+        assert json.load(cache_file)[http_server.url]['etag'] == '"2"'
+
+
+def test_each_url_is_requested_once(http_server, project):
+    http_server.body = VERSIONS
+    pairs = [{'url': http_server.url, 'file': project}] * 3
+
+    rows = api_version.check_projects(pairs, 4, 5, 0)
+    assert [row['latest_version'] for row in rows] == [59.0] * 3
+    assert len(http_server.requests) == 1
+
+
+def test_failed_request_reports_unknown(http_server, project):
+    http_server.status = 500
+    rows = api_version.check_projects([{'url': http_server.url, 'file': project}], 2, 5, 0)
+    assert rows[0]['latest_version'] is None
+    assert rows[0]['behind'] is None
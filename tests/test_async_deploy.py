@@ -0,0 +1,62 @@
+"""
+    Tests of the async deploy-and-poll mode against the stub sfdx.
+"""
+import json
+
+import async_deploy
+import deploy_metadata_sfdx
+
+
+def submitted(deploy_id):
+    return (json.dumps({'status': 0, 'result': {'id': deploy_id}}), 0)
+
+
+def report(deploy_id, success):
+    return (json.dumps({'status': 0 if success else 1,
+                        'result': {'id': deploy_id, 'done': True, 'success': success,
+                                   'status': 'Succeeded' if success else 'Failed'}}),
+            0 if success else 1)
+
+
+def test_resume_prunes_reported_deployments(sfdx, tmp_path):
+    state_file = str(tmp_path / 'deploy_state.json')
+    sfdx.respond('force:source:deploy', submitted('0Af000000000001'),
+                 submitted('0Af000000000002'))
+    sfdx.respond('force:source:deploy:report', report('0Af000000000001', False),
+                 report('0Af000000000002', True))
+
+    assert deploy_metadata_sfdx.deploy_async(None, 'delta.xml', 1, False, 'uat',
+                                             state_file, 0, False) == 1
+    assert async_deploy.load_state(state_file) == {'deployments': []}
+    # the failed deployment was reported, so it doesn't fail the next run
+    assert deploy_metadata_sfdx.deploy_async(None, 'delta.xml', 1, False, 'uat',
+                                             state_file, 0, False) == 0
+    assert async_deploy.load_state(state_file) == {'deployments': []}
+
+
+def test_detached_deployment_is_resumed_later(sfdx, tmp_path):
+    state_file = str(tmp_path / 'deploy_state.json')
+    sfdx.respond('force:source:deploy', submitted('0Af000000000001'))
+    sfdx.respond('force:source:deploy:report', report('0Af000000000001', True))
+
+    assert deploy_metadata_sfdx.deploy_async(None, 'delta.xml', 1, False, 'uat',
+                                             state_file, 0, True) == 0
+    assert [deployment['id'] for deployment
+            in async_deploy.in_flight(async_deploy.load_state(state_file))] == ['0Af000000000001']
+
+    assert async_deploy.resume(state_file, 60) == 0
+    assert async_deploy.load_state(state_file) == {'deployments': []}
+    assert sfdx.calls()[-1][:3] == ['force:source:deploy:report', '-i', '0Af000000000001']
+
+
+def test_other_deployments_stay_in_the_state_file(sfdx, tmp_path):
+    state_file = str(tmp_path / 'deploy_state.json')
+    async_deploy.save_state({'deployments': [{'id': '0Af000000000009', 'done': False}]},
+                            state_file)
+    sfdx.respond('force:source:deploy', submitted('0Af000000000001'))
+    sfdx.respond('force:source:deploy:report', report('0Af000000000001', True))
+
+    assert deploy_metadata_sfdx.deploy_async(None, 'delta.xml', 1, False, None,
+                                             state_file, 0, False) == 0
+    assert [deployment['id'] for deployment
+            in async_deploy.load_state(state_file)['deployments']] == ['0Af000000000009']
@@ -0,0 +1,56 @@
+"""
+    Tests of the multi-manifest, multi-org deploy mode against the stub sfdx.
+"""
+import json
+
+import deploy_metadata_sfdx
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+    return str(path)
+
+
+def test_failed_job_fails_the_run(sfdx, tmp_path):
+    sfdx.respond('force:source:deploy', ('Deploy ID: 0Af000000000001\n', 0),
+                 ('Deploy ID: 0Af000000000002\n', 1))
+    jobs_file = write_json(tmp_path / 'jobs.json',
+                           [{'manifest': 'delta_1.xml', 'alias': 'uat'},
+                            {'manifest': 'delta_2.xml', 'alias': 'prod'}])
+    tasks = deploy_metadata_sfdx.load_jobs(jobs_file, None, 'https://org.my.salesforce.com')
+
+    returncode = deploy_metadata_sfdx.run_jobs(tasks, 'MyTest', 10, False,
+                                               str(tmp_path / 'logs'), 1)
+
+    assert returncode == 1
+    assert [call[call.index('-u') + 1] for call in sfdx.calls()] == ['uat', 'prod']
+    with open(tmp_path / 'logs' / 'uat_delta_1.log', encoding='utf-8') as log_file:
+        assert 'Deploy ID: 0Af000000000001' in log_file.read()
+
+
+def test_failed_chunk_skips_the_next_chunks(sfdx, tmp_path):
+    sfdx.respond('force:source:deploy', ('', 1))
+    index_file = write_json(tmp_path / 'delta_chunks.json',
+                            {'chunks': [{'manifest': 'delta_1.xml'},
+                                        {'manifest': 'delta_2.xml'}]})
+    tasks = deploy_metadata_sfdx.load_jobs(index_file, 'uat', None)
+
+    returncode = deploy_metadata_sfdx.run_jobs(tasks, None, 10, False,
+                                               str(tmp_path / 'logs'), 2)
+
+    assert returncode == 1
+    assert len(sfdx.calls()) == 1
+    assert 'delta_1.xml' in sfdx.calls()[0]
+
+
+def test_missing_sfdx_fails_the_job(sfdx, tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    tasks = [[{'manifest': 'delta.xml', 'alias': 'uat'}]]
+
+    returncode = deploy_metadata_sfdx.run_jobs(tasks, None, 10, False,
+                                               str(tmp_path / 'logs'), 1)
+
+    assert returncode == 1
+    with open(tmp_path / 'logs' / 'uat_delta.log', encoding='utf-8') as log_file:
+        assert 'Could not run sfdx' in log_file.read()
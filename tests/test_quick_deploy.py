@@ -0,0 +1,70 @@
+"""
+    Tests of the quick deploy of cached validations against the stub sfdx.
+"""
+import subprocess
+
+import pytest
+
+import deploy_metadata_sfdx
+import quick_deploy
+
+
+@pytest.fixture
+def repo(sfdx, tmp_path):
+    """
+        Commit a manifest in the test folder, the cache key needs a commit.
+    """
+    (tmp_path / 'delta.xml').write_text('<Package/>\n', encoding='utf-8')
+    for command in (['git', 'init', '-q'], ['git', 'add', 'delta.xml'],
+                    ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                     'commit', '-q', '-m', 'delta']):
+        subprocess.run(command, cwd=tmp_path, check=True)
+    return str(tmp_path / 'quick_deploys.json')
+
+
+def deploy(quick_cache, validate=False, quick=False):
+    deploy_metadata_sfdx.main('MyTest', 'delta.xml', 10, None, 'deploy.log', validate, False,
+                              alias='uat', quick=quick, quick_cache=quick_cache)
+
+
+def test_failed_quick_deploy_falls_back_to_a_full_deploy(sfdx, repo):
+    sfdx.respond('force:source:deploy', ('Deploy ID: 0Af000000000001\n', 0),
+                 ('Deploy ID: 0Af000000000002\n', 1), ('Deploy ID: 0Af000000000003\n', 0))
+
+    deploy(repo, validate=True)
+    assert list(quick_deploy.load_cache(repo).values())[0]['deploy_id'] == '0Af000000000001'
+
+    deploy(repo, quick=True)
+    calls = sfdx.calls()
+    assert '-c' in calls[0]
+    assert calls[1][calls[1].index('-q') + 1] == '0Af000000000001'
+    assert '-q' not in calls[2] and '-c' not in calls[2]
+    # a rejected validation is not tried again
+    assert quick_deploy.load_cache(repo) == {}
+
+
+def test_quick_deploy_without_validation_runs_a_full_deploy(sfdx, repo):
+    sfdx.respond('force:source:deploy', ('Deploy ID: 0Af000000000001\n', 0))
+
+    deploy(repo, quick=True)
+    assert len(sfdx.calls()) == 1
+    assert '-q' not in sfdx.calls()[0]
+
+
+def test_validation_is_quick_deployed_once(sfdx, repo):
+    sfdx.respond('force:source:deploy', ('Deploy ID: 0Af000000000001\n', 0),
+                 ('Deploy ID: 0Af000000000002\n', 0))
+
+    deploy(repo, validate=True)
+    deploy(repo, quick=True)
+    assert len(sfdx.calls()) == 2
+    assert '-q' in sfdx.calls()[1]
+    assert quick_deploy.load_cache(repo) == {}
+
+
+def test_failed_full_deploy_exits_with_an_error(sfdx, repo):
+    sfdx.respond('force:source:deploy', ('', 1))
+
+    with pytest.raises(SystemExit) as exit_info:
+        deploy(repo, quick=True)
+    assert exit_info.value.code == 1
@@ -0,0 +1,223 @@
+"""
+    Keep a delta package.xml up to date while files are edited.
+    The delta of the working tree against the base branch is built once,
+    then the package directories are polled for mtime/size changes and
+    only the changed paths are classified again. The manifest is rewritten
+    atomically after each change. An edit of sfdx-project.json rebuilds
+    the delta with the new package directories.
+    python ./watch_delta.py -b main -d delta.xml
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+# import local scripts
+import check_package_dir
+import create_delta_package
+import git_diff
+import manifest_merge
+import metadata_index
+import package_writer
+
+# Format logging message
+logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+
+
+def parse_args(argv=None):
+    """
+        Function to parse required arguments.
+        base - branch or commit the working tree is compared to
+        json - sfdx-project.json
+        delta - delta file kept up to date by this script
+        manifest - manual manifest file to merge with delta
+        interval - seconds between two polls of the package directories
+        polls - stop after this many polls (0 = run until interrupted)
+    """
+    parser = argparse.ArgumentParser(description='A script to keep the delta package up to date.')
+    parser.add_argument('-b', '--base', default='main')
+    parser.add_argument('-j', '--json', default='./sfdx-project.json')
+    parser.add_argument('-d', '--delta', default='delta.xml')
+    parser.add_argument('-m', '--manifest', default='manifest/package.xml')
+    parser.add_argument('-i', '--interval', type=float, default=1.0)
+    parser.add_argument('-n', '--polls', type=int, default=0)
+    args = parser.parse_args(argv)
+    return args
+
+
+def snapshot(folders):
+    """
+        Function to list every file of the folders: path -> (mtime, size)
+        Paths use / like git.
+    """
+    files = {}
+    pending = list(folders)
+    while pending:
+        folder = pending.pop()
+        try:
+            entries = os.scandir(folder)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files[entry.path.replace(os.sep, '/')] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def changed_paths(before, after):
+    """
+        Function to list the paths created, deleted or modified between two snapshots.
+    """
+    paths = {path for path, state in after.items() if before.get(path) != state}
+    paths.update(path for path in before if path not in after)
+    return sorted(paths)
+
+
+def untracked_files(paths):
+    """
+        Function to list the files under the paths which git doesn't track yet.
+    """
+    output = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard', '-z',
+                             '--', *paths], stdout=subprocess.PIPE, check=True)
+    return [path.decode('utf-8', errors='surrogateescape')
+            for path in output.stdout.split(b'\0') if path]
+
+
+def compare_to_base(base, paths=None):
+    """
+        Function to diff the working tree against the base, only for the paths if set.
+        Returns the streamed diff, untracked files are listed
+        as added (status A) with no blob SHAs.
+    """
+    entries = {}
+    command = ['git', 'diff', '--raw', '-z', '--no-abbrev', base]
+    if paths is not None:
+        command.extend(['--', *paths])
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        records = git_diff.read_nul_records(process.stdout)
+        for header in records:
+            # :100644 100644 <old sha> <new sha> <status>
+            fields = header.lstrip(':').split(' ')
+            path = next(records)
+            if fields[4][0] in ('R', 'C'):
+                path = next(records)
+            entries[path] = (fields[4][0], fields[2], fields[3])
+    for path in untracked_files(paths or []):
+        entries[path] = ('A', None, None)
+    return git_diff.GitDiffStream(base, None, entries)
+
+
+def classify(diffs, trie):
+    """
+        Function to classify the changed files inside the package directories.
+        Returns path -> list of (component type, members).
+    """
+    components = {}
+    for path in diffs:
+        if trie.route(path) is None:
+            continue
+        if diffs.blob_shas(path) == (None, None):
+            # untracked files have no diff to parse, so containers are added whole
+            components[path] = [metadata_index.resolve(path)]
+        else:
+            components[path] = create_delta_package.find_components(path, diffs)
+    return components
+
+
+def write_manifest(components, manual_items, delta, json_file):
+    """
+        Function to merge the components of every changed path
+        and replace the delta file atomically.
+    """
+    items = {component_type: set(members) for component_type, members in manual_items.items()}
+    for path_components in components.values():
+        for component_type, members in path_components:
+            if component_type and members:
+                items.setdefault(component_type, set()).update(members)
+    temp_file = f'{delta}.tmp'
+    package_writer.create_package_xml(items, temp_file, json_file)
+    os.replace(temp_file, delta)
+
+
+def package_folders(json_file):
+    """
+        Function to list the package directories as git paths (relative
+        to the root of the repo, without ./) and their routing trie.
+    """
+    check_package_dir.main(json_file)
+    folders = ['/'.join(check_package_dir.split_path(path))
+               for path in check_package_dir.package_paths(json_file)]
+    return folders, check_package_dir.PackageTrie(folders)
+
+
+def build(base, json_file, delta, manual_items):
+    """
+        Function to build the whole delta.
+        Returns the package folders, their trie, the snapshot and the components.
+    """
+    start = time.perf_counter()
+    folders, trie = package_folders(json_file)
+    state = snapshot(folders)
+    components = classify(compare_to_base(base), trie)
+    write_manifest(components, manual_items, delta, json_file)
+    logging.info('Watching %s files, %s changed against %s (%.2fs)',
+                 len(state), len(components), base, time.perf_counter() - start)
+    return folders, trie, state, components
+
+
+def main(base, json_file, delta, manifest, interval, polls=0):
+    """
+        Main function to build the delta once and update it on every change.
+    """
+    manual_items = {}
+    if manifest:
+        manual_items, _stats = manifest_merge.merge_manifests([manifest])
+
+    project_mtime = os.stat(json_file).st_mtime_ns
+    folders, trie, state, components = build(base, json_file, delta, manual_items)
+
+    count = 0
+    while not polls or count < polls:
+        time.sleep(interval)
+        count += 1
+        if os.stat(json_file).st_mtime_ns != project_mtime:
+            # package directories may have been added or removed
+            project_mtime = os.stat(json_file).st_mtime_ns
+            logging.info('%s changed, rebuilding %s', json_file, delta)
+            folders, trie, state, components = build(base, json_file, delta, manual_items)
+            continue
+        current = snapshot(folders)
+        paths = changed_paths(state, current)
+        state = current
+        if not paths:
+            continue
+        start = time.perf_counter()
+        for path in paths:
+            components.pop(path, None)
+        components.update(classify(compare_to_base(base, paths), trie))
+        write_manifest(components, manual_items, delta, json_file)
+        logging.info('%s changed, %s updated in %.0f ms', ', '.join(paths), delta,
+                     (time.perf_counter() - start) * 1000)
+
+
+def run(inputs):
+    """
+        Run the script with the parsed arguments.
+        Returns the exit code.
+    """
+    try:
+        main(inputs.base, inputs.json, inputs.delta, inputs.manifest,
+             inputs.interval, inputs.polls)
+    except KeyboardInterrupt:
+        logging.info('Stopped watching.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args()))
@@ -2,24 +2,61 @@
     Required modules
 """
 from xml.etree import ElementTree as et
+from xml.sax.saxutils import escape, quoteattr
 
 # register_namespace only influences serialization, not search
 # use both to search the XML (search for apex) and serialize the XML (combine & append element)
 et.register_namespace('', 'http://soap.sforce.com/2006/04/metadata')
 name_space = {'sforce': 'http://soap.sforce.com/2006/04/metadata'}
 
+# identity field(s) of the repeated elements in profiles and permission sets
+identity_Fields = {
+    'applicationVisibilities': ('application',),
+    'categoryGroupVisibilities': ('dataCategoryGroup',),
+    'classAccesses': ('apexClass',),
+    'customMetadataTypeAccesses': ('name',),
+    'customPermissions': ('name',),
+    'customSettingAccesses': ('name',),
+    'externalDataSourceAccesses': ('externalDataSource',),
+    'fieldPermissions': ('field',),
+    'flowAccesses': ('flow',),
+    'layoutAssignments': ('layout', 'recordType'),
+    'loginIpRanges': ('startAddress', 'endAddress'),
+    'objectPermissions': ('object',),
+    'pageAccesses': ('apexPage',),
+    'profileActionOverrides': ('actionName', 'pageOrSobjectType', 'recordType'),
+    'recordTypeVisibilities': ('recordType',),
+    'tabSettings': ('tab',),
+    'tabVisibilities': ('tab',),
+    'userPermissions': ('name',),
+}
+# elements which can only be present once
+single_Fields = ['custom', 'description', 'fullName', 'hasActivationRequired',
+                 'label', 'license', 'loginHours', 'userLicense']
+
 class XMLParser(object):
     """
         Class to parse Salesforce XMLs. (input - tuple)
     """
     def __init__(self, filenames):
         assert len(filenames) > 0, 'No filenames!'
-        if len(filenames) > 1:
-            # save all roots, in order, to be processed later
-            self.roots = [et.parse(filename).getroot() for filename in filenames]
-        else:
-            # extract the single string from the tuple
-            self.roots = et.parse(filenames[0]).getroot()
+        self.filenames = filenames
+        self._roots = None
+
+    @property
+    def roots(self):
+        """
+            Parse the files the first time the roots are used,
+            so merge() doesn't load every tree.
+        """
+        if self._roots is None:
+            if len(self.filenames) > 1:
+                # save all roots, in order, to be processed later
+                self._roots = [et.parse(filename).getroot() for filename in self.filenames]
+            else:
+                # extract the single string from the tuple
+                self._roots = et.parse(self.filenames[0]).getroot()
+        return self._roots
 
     def combine(self):
         """
@@ -38,6 +75,57 @@ class XMLParser(object):
         for element in other:
             one.append(element)
 
+    def merge(self, output_file):
+        """
+            Function to merge profiles or permission sets.
+            Repeated elements are keyed by their identity field (field, object,
+            apexClass...) so later files overwrite earlier ones instead of
+            adding duplicates. Each file is streamed and the result is
+            written to the output file sorted by element and identity.
+        """
+        merged = {}
+        root_tag = None
+        for filename in self.filenames:
+            depth = 0
+            root = None
+            for event, element in et.iterparse(filename, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        root = element
+                        root_tag = root_tag or element.tag
+                    continue
+                depth -= 1
+                # direct children of the root are complete, index and release them
+                if depth == 1:
+                    merged[self.identity(element)] = element
+                    root.clear()
+
+        with open(output_file, 'w', encoding='utf-8') as output:
+            output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            output.write(f'<{local_name(root_tag)} xmlns={quoteattr(name_space["sforce"])}>\n')
+            for key in sorted(merged):
+                write_element(output, merged[key], '    ')
+            output.write(f'</{local_name(root_tag)}>\n')
+        return output_file
+
+    @staticmethod
+    def identity(element):
+        """
+            Function to build the merge key of a root child element.
+        """
+        tag = local_name(element.tag)
+        if tag in identity_Fields:
+            values = []
+            for field in identity_Fields[tag]:
+                value = element.find(f'sforce:{field}', name_space)
+                values.append(value.text if value is not None and value.text else '')
+            return (tag, *values)
+        if tag in single_Fields:
+            return (tag,)
+        # unknown repeated elements are only merged when they are identical
+        return (tag, et.tostring(element, encoding='unicode'))
+
     def search_for_apex(self):
         """
             This function searches the XML for types that require Apex tests.
@@ -54,3 +142,27 @@ class XMLParser(object):
                 tests = True
                 break
         return tests
+
+
+def local_name(tag):
+    """
+        Remove the namespace from the tag, {namespace}field -> field
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def write_element(output, element, indent):
+    """
+        Write an element and its children without namespace prefixes.
+    """
+    tag = local_name(element.tag)
+    attributes = ''.join(f' {local_name(name)}={quoteattr(value)}'
+                         for name, value in sorted(element.attrib.items()))
+    children = list(element)
+    if children:
+        output.write(f'{indent}<{tag}{attributes}>\n')
+        for child in children:
+            write_element(output, child, indent + '    ')
+        output.write(f'{indent}</{tag}>\n')
+    else:
+        output.write(f'{indent}<{tag}{attributes}>{escape(element.text or "")}</{tag}>\n')